@@ -39,11 +39,24 @@ def compile_configuration(confobjc):
     standard.DL_SERVER = confobjc.get("DL_SERVER", standard.DL_SERVER)
     standard.PUBLISH_CHANGES = confobjc.get("PUBLISH_CHANGES", standard.PUBLISH_CHANGES)
     standard.CRON_SLEEP = confobjc.get("CRON_SLEEP", standard.CRON_SLEEP)
+    standard.BUFFER_SIZE = confobjc.get("BUFFER_SIZE", standard.BUFFER_SIZE)
+    standard.INGEST_WORKERS = confobjc.get("INGEST_WORKERS", standard.INGEST_WORKERS)
+    standard.UNIFIED_BRANCHES = confobjc.get("UNIFIED_BRANCHES", standard.UNIFIED_BRANCHES)
     standard.LOGGING = confobjc.get("LOGGING", standard.LOGGING)
     standard.repomd_xml_namespace = confobjc.get(
         "repomd_xml_namespace", standard.repomd_xml_namespace
     )
     standard.APPSERVE = confobjc.get("APPSERVE", standard.APPSERVE)
+    standard.CATALOG_REFRESH = confobjc.get("CATALOG_REFRESH", standard.CATALOG_REFRESH)
+    standard.RESPONSE_CACHE = confobjc.get("RESPONSE_CACHE", standard.RESPONSE_CACHE)
+    standard.SEARCH_CACHE = confobjc.get("SEARCH_CACHE", standard.SEARCH_CACHE)
+    standard.COMPRESSION = confobjc.get("COMPRESSION", standard.COMPRESSION)
+    standard.PAGE_LIMIT = confobjc.get("PAGE_LIMIT", standard.PAGE_LIMIT)
+    standard.BULK_LIMIT = confobjc.get("BULK_LIMIT", standard.BULK_LIMIT)
+    standard.FANOUT_LIMIT = confobjc.get("FANOUT_LIMIT", standard.FANOUT_LIMIT)
+    standard.SEARCH = confobjc.get("SEARCH", standard.SEARCH)
+    standard.SUGGEST = confobjc.get("SUGGEST", standard.SUGGEST)
+    standard.IMPACT_DEPTH = confobjc.get("IMPACT_DEPTH", standard.IMPACT_DEPTH)
 
     if not os.path.exists(standard.DB_FOLDER):
         # Cannot pull/push data from/into directory that does not exist
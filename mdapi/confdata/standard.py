@@ -67,6 +67,16 @@ PUBLISH_CHANGES = False
 # How long to wait between retries if processing failed
 CRON_SLEEP = 30
 
+# Size (in bytes) of the chunks the databases are downloaded and extracted in
+BUFFER_SIZE = 1024 * 1024
+
+# How many repositories to process at once
+INGEST_WORKERS = 4
+
+# Whether to consolidate the primary databases of all the repositories of every branch into one
+# database, so that the service finds a package with a single query instead of one per repository
+UNIFIED_BRANCHES = False
+
 repomd_xml_namespace = {
     "repo": "http://linux.duke.edu/metadata/repo",
     "rpm": "http://linux.duke.edu/metadata/rpm",
@@ -81,3 +91,55 @@ APPSERVE = {
     "bind": "0.0.0.0:8080",
     "worker_class": "aiohttp.GunicornUVLoopWebWorker",
 }
+
+# How often (in seconds) to look for the databases installed by the ingest step
+CATALOG_REFRESH = 5
+
+# Bounds of the in-process cache of rendered package responses - the number of entries, the
+# memory (in bytes) used by all of them and the largest response (in bytes) that gets cached
+RESPONSE_CACHE = {
+    "entries": 2048,
+    "memory": 256 * 1024 * 1024,
+    "item": 8 * 1024 * 1024,
+}
+
+# Bounds of the cache of the responses to the searches and the suggestions, kept apart so that
+# their endless variety of queries does not evict the package responses
+SEARCH_CACHE = {
+    "entries": 256,
+    "memory": 16 * 1024 * 1024,
+    "item": 1024 * 1024,
+}
+
+# Largest number of files or changelog entries returned in a page, also used when the client
+# asks for a page without setting its size
+PAGE_LIMIT = 1000
+
+# Largest number of package names accepted by a single bulk lookup
+BULK_LIMIT = 2000
+
+# Longest text (in characters) accepted by the full-text search, largest number of packages
+# returned in a page of its results, also used when the client does not set the size of the page,
+# and largest number of results that can be skipped to get to a page
+SEARCH = {"length": 256, "limit": 100, "depth": 1000}
+
+# Longest fragment (in characters) accepted by the suggestion of package names, largest number of
+# names suggested and number of candidate names ranked in every database to suggest them
+SUGGEST = {"length": 128, "limit": 10, "candidates": 200}
+
+# Largest number of hops followed from the packages built from a source package when looking for
+# the packages requiring them, also used when the client does not set it
+IMPACT_DEPTH = 10
+
+# Largest number of branches looked up at once when a package is queried in all of them
+FANOUT_LIMIT = 8
+
+# Responses larger than "minimum" (in bytes) are compressed with the most preferred encoding
+# accepted by the client, at the level set here for it - set an encoding to None to disable it,
+# "br" is only offered when the brotli module is installed
+COMPRESSION = {
+    "minimum": 1024,
+    "zstd": 9,
+    "br": 5,
+    "gzip": 6,
+}
@@ -21,20 +21,408 @@ License and may only be used or replicated with the express permission
 of Red Hat, Inc.
 """
 
+import itertools
+import json
+import os
 import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from dataclasses import dataclass
 
 from mdapi.confdata import servlogr
-from mdapi.database.sqlq import DEFAULT_QUERY, INDEX_DATABASE, OBTAIN_TABLE_NAMES, queries
+from mdapi.database.rpmvers import evr_key, source_name
+from mdapi.database.sqlq import (
+    ADD_COLUMN,
+    ANALYZE_DATABASE,
+    ATTACH_SOURCE,
+    CREATE_CAPABILITIES,
+    CREATE_CROSSING,
+    CREATE_INDEX,
+    CREATE_UNIFIED_PACKAGES,
+    DEFAULT_QUERY,
+    DEPGRAPH_EDGES,
+    DEPGRAPH_INDEX_REDGES,
+    DEPGRAPH_NODES,
+    DEPGRAPH_REDGES,
+    DEPGRAPH_TABLES,
+    DEPGRAPH_UNRESOLVED,
+    DERIVED_COLUMNS,
+    DERIVED_TABLES,
+    DETACH_SOURCE,
+    DROP_TEMP_TABLE,
+    FILEPATH_ROWS,
+    FILL_CAPABILITIES,
+    FILL_COLUMN,
+    FILL_CROSSING,
+    FILL_DEPGRAPH,
+    FILL_FILEPATH,
+    FILL_UNIFIED_PACKAGES,
+    INDICES,
+    OBTAIN_INDEX_COLUMNS,
+    OBTAIN_TABLE_NAMES,
+    SOURCE_DEPGRAPH_COLUMNS,
+    SOURCE_PROVIDERS,
+    SOURCE_UNRESOLVED,
+    queries,
+)
+
+MANIFEST_NAME = "mdapi-manifest.json"
+
+# Repositories of a branch, in the order in which they are looked up for a package
+REPOTYPES = ["updates-testing", "updates", "testing", None]
+
+# The "unified" database consolidates the primary databases of all the repositories of a branch
+KINDS = ["primary", "filelists", "other", "unified"]
+
+# The repositories are ingested concurrently and every one of them records its databases
+MANIFEST_LOCK = threading.Lock()
+
+DERIVED_TABLE_NAMES = {item[1] for entries in DERIVED_TABLES.values() for item in entries}
+
+
+def select_providers(found, named):
+    """
+    Return the packages to pull in for a requirement out of those providing it - the package named
+    after the capability if there is one, like the package managers prefer, else all of them
+    """
+    return {named} if named in found else found
+
+
+def _grouped_by_node(connobjc, sqlquery):
+    """
+    Yield the node and the list of the values of every group of rows of the query, whose rows are
+    pairs of a node and a value ordered by node
+    """
+    for node, rowslist in itertools.groupby(connobjc.execute(sqlquery), key=lambda item: item[0]):
+        yield (node, [item[1] for item in rowslist])
+
+
+def build_depgraph(connobjc):
+    """
+    Compile the provides, files and requires tables into the depgraph table, whose edges are the
+    nodes of the packages providing the requirements of a package and whose reverse edges are the
+    nodes of the packages requiring it, as arrays of unsigned integers in the byte order of the
+    machine - the requirements are matched against their providers in temporary tables so that
+    only the edges of a single node at a time are held in memory
+    """
+    for creation, filling in DEPGRAPH_TABLES.values():
+        connobjc.execute(creation)
+        connobjc.execute(filling)
+    connobjc.execute(DEPGRAPH_INDEX_REDGES)
+
+    groups = [
+        _grouped_by_node(connobjc, sqlquery)
+        for sqlquery in (DEPGRAPH_EDGES, DEPGRAPH_REDGES, DEPGRAPH_UNRESOLVED)
+    ]
+    upcoming = [next(group, None) for group in groups]
+
+    def rows():
+        for node, pkgname in connobjc.execute(DEPGRAPH_NODES):
+            values = []
+            for indx, group in enumerate(groups):
+                if upcoming[indx] and upcoming[indx][0] == node:
+                    values.append(upcoming[indx][1])
+                    upcoming[indx] = next(group, None)
+                else:
+                    values.append([])
+            edges, redges, unresolved = values
+            yield (
+                node,
+                pkgname,
+                array("I", edges).tobytes(),
+                array("I", redges).tobytes(),
+                json.dumps(unresolved),
+            )
+
+    connobjc.executemany(FILL_DEPGRAPH, rows())
+    for table in reversed(DEPGRAPH_TABLES):
+        connobjc.execute(DROP_TEMP_TABLE.format(table=table))
+
+
+def build_filepath(connobjc):
+    """
+    Split the names of the files of every directory of the filelist table into the filepath table,
+    one row at a time so that the cost stays linear in the number of files
+    """
+    connobjc.executemany(
+        FILL_FILEPATH,
+        (
+            (f"{dirname.rstrip('/')}/{filename}", pkgKey)
+            for pkgKey, dirname, filenames in connobjc.execute(FILEPATH_ROWS)
+            for filename in (filenames or "").split("/")
+            if filename
+        ),
+    )
+
+
+# Builders of the derived tables that cannot be filled by a query
+DERIVED_BUILDERS = {"depgraph": build_depgraph, "filepath": build_filepath}
 
 
 def index_database(name, tempdtbs):
     servlogr.logrobjc.info(f"[{name}] Indexing database {tempdtbs}")
-    if tempdtbs.endswith("primary.sqlite"):
-        # TODO: Try the "with sqlite3.connect(tempdtbs) as connobjc" statement here
-        connobjc = sqlite3.connect(tempdtbs)
-        connobjc.execute(INDEX_DATABASE)
+    kind = os.path.basename(tempdtbs)[: -len(".sqlite")].rpartition("-")[2]
+    if kind not in INDICES:
+        return
+
+    connobjc = sqlite3.connect(tempdtbs)
+    connobjc.create_function("evr_key", 3, evr_key, deterministic=True)
+    connobjc.create_function("source_name", 1, source_name, deterministic=True)
+    tblelist = {item[0] for item in connobjc.execute(OBTAIN_TABLE_NAMES)}
+
+    for source, table, creation, filling in DERIVED_TABLES.get(kind, []):
+        if source not in tblelist:
+            continue
+        strttime = time.monotonic()
+        try:
+            connobjc.execute(creation)
+            if filling:
+                connobjc.execute(filling)
+            else:
+                DERIVED_BUILDERS[table](connobjc)
+        except sqlite3.OperationalError as excp:
+            # Such as when SQLite is built without the extension the table needs
+            servlogr.logrobjc.error(f"[{name}] Could not derive {table} from {source} - {excp}")
+            continue
+        tblelist.add(table)
+        servlogr.logrobjc.info(f"[{name}] Derived {table} from {source} in {time.monotonic() - strttime:.3f}s")  # noqa : E501
+
+    for table, column, value in DERIVED_COLUMNS.get(kind, []):
+        if table not in tblelist:
+            continue
+        strttime = time.monotonic()
+        connobjc.execute(ADD_COLUMN.format(table=table, column=column))
+        connobjc.execute(FILL_COLUMN.format(table=table, column=column, value=value))
+        servlogr.logrobjc.info(f"[{name}] Derived {table}.{column} in {time.monotonic() - strttime:.3f}s")  # noqa : E501
+
+    # The columns of the indices that are already there, in order, keyed by table
+    existing = {}
+    for table, index, _, column in sorted(connobjc.execute(OBTAIN_INDEX_COLUMNS)):
+        existing.setdefault((table, index), []).append(column)
+    existing = {(table, ", ".join(columns)) for (table, _), columns in existing.items()}
+
+    for table, index, columns in INDICES[kind]:
+        if table not in tblelist:
+            servlogr.logrobjc.debug(f"[{name}] No {table} table to index with {index}")
+            continue
+        if (table, columns) in existing:
+            servlogr.logrobjc.debug(f"[{name}] {table} ({columns}) is already indexed")
+            continue
+        strttime = time.monotonic()
+        connobjc.execute(CREATE_INDEX.format(index=index, table=table, columns=columns))
+        existing.add((table, columns))
+        servlogr.logrobjc.info(f"[{name}] Created index {index} on {table} ({columns}) in {time.monotonic() - strttime:.3f}s")  # noqa : E501
+
+    # Gather the statistics the query planner needs to choose between the indices
+    strttime = time.monotonic()
+    connobjc.execute(ANALYZE_DATABASE)
+    servlogr.logrobjc.info(f"[{name}] Analyzed {tempdtbs} in {time.monotonic() - strttime:.3f}s")
+    connobjc.commit()
+    connobjc.close()
+
+
+def unify_databases(name, tempdtbs, sources):
+    """
+    Consolidate the packages of the given primary databases, as pairs of the repository and the
+    database in the order in which the repositories are looked up, into a single database
+    """
+    servlogr.logrobjc.info(f"[{name}] Unifying {len(sources)} databases into {tempdtbs}")
+    connobjc = sqlite3.connect(tempdtbs)
+    connobjc.create_function("evr_key", 3, evr_key, deterministic=True)
+    connobjc.create_function("source_name", 1, source_name, deterministic=True)
+    connobjc.execute(CREATE_UNIFIED_PACKAGES)
+    for rank, (repo, dtbsfile) in enumerate(sources):
+        strttime = time.monotonic()
+        connobjc.execute(ATTACH_SOURCE, (dtbsfile,))
+        connobjc.execute(FILL_UNIFIED_PACKAGES, (repo, rank))
         connobjc.commit()
-        connobjc.close()
+        connobjc.execute(DETACH_SOURCE)
+        servlogr.logrobjc.info(f"[{name}] Unified {dtbsfile} in {time.monotonic() - strttime:.3f}s")
+
+    strttime = time.monotonic()
+    if build_crossing(connobjc, sources):
+        servlogr.logrobjc.info(f"[{name}] Derived crossing in {time.monotonic() - strttime:.3f}s")
+    connobjc.close()
+
+
+def build_crossing(connobjc, sources):
+    """
+    Resolve the requirements left unresolved by the dependency graph of every one of the given
+    primary databases in all of them into the crossing table, and return whether it was built,
+    which it is not if any of them lacks its dependency graph
+    """
+    unresolved = []
+    for repo, dtbsfile in sources:
+        connobjc.execute(ATTACH_SOURCE, (dtbsfile,))
+        columns = {item[0] for item in connobjc.execute(SOURCE_DEPGRAPH_COLUMNS)}
+        if {"redges", "unresolved"} <= columns:
+            for pkgname, capabilities in connobjc.execute(SOURCE_UNRESOLVED):
+                unresolved.extend((pkgname, repo, item) for item in json.loads(capabilities))
+        connobjc.execute(DETACH_SOURCE)
+        if not {"redges", "unresolved"} <= columns:
+            return False
+
+    connobjc.execute(CREATE_CAPABILITIES)
+    connobjc.executemany(FILL_CAPABILITIES, {(item[2],) for item in unresolved})
+    connobjc.commit()
+    providers = {}
+    for _, dtbsfile in sources:
+        connobjc.execute(ATTACH_SOURCE, (dtbsfile,))
+        for capability, pkgname in connobjc.execute(SOURCE_PROVIDERS):
+            providers.setdefault(capability, set()).add(pkgname)
+        connobjc.execute(DETACH_SOURCE)
+
+    connobjc.execute(CREATE_CROSSING)
+    connobjc.executemany(
+        FILL_CROSSING,
+        (
+            (provider, pkgname, repo)
+            for pkgname, repo, capability in unresolved
+            for provider in select_providers(providers.get(capability, set()), capability)
+        ),
+    )
+    connobjc.commit()
+    return True
+
+
+def read_manifest(folder):
+    """
+    Return the manifest of the databases installed in the given directory, which maps the name
+    of every database to the checksum published for it in repomd.xml, and that of the repomd.xml
+    of every repository to the validators it was last served with
+    """
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME)) as fileobjc:
+            return json.load(fileobjc)
+    except (OSError, ValueError):
+        return {}
+
+
+def matches_manifest(recorded, destfile, checksum):
+    """
+    Return whether the given record of the manifest is about the given checksum and the database
+    currently installed at the given path, which has not been replaced nor modified since then as
+    long as it has the same inode, size and modification time
+    """
+    statobjc = os.stat(destfile)
+    return recorded.get("checksum") == checksum and (
+        recorded.get("inode"),
+        recorded.get("size"),
+        recorded.get("mtime"),
+    ) == (statobjc.st_ino, statobjc.st_size, statobjc.st_mtime_ns)
+
+
+def update_manifest(folder, key, record):
+    """
+    Replace the given record of the manifest of the given directory
+    """
+    with MANIFEST_LOCK:
+        manifest = read_manifest(folder)
+        manifest[key] = record
+
+        # Write the manifest in place atomically so that the web service never reads half of it
+        filedesc, tempname = tempfile.mkstemp(prefix="mdapi-tempmnft-", dir=folder)
+        with os.fdopen(filedesc, "w") as fileobjc:
+            json.dump(manifest, fileobjc, indent=4, sort_keys=True)
+        os.chmod(tempname, 0o644)
+        os.replace(tempname, os.path.join(folder, MANIFEST_NAME))
+
+
+def record_manifest(name, destfile, checksum, sources=None):
+    """
+    Record the checksum of a database in the manifest of the directory it is installed in along
+    with its inode, size and modification time, so that the record can be told apart from a
+    database installed or modified later, and with the identities of the databases it was built
+    from if it was built from others
+    """
+    folder, database = os.path.split(destfile)
+    statobjc = os.stat(destfile)
+    record = {
+        "checksum": checksum,
+        "inode": statobjc.st_ino,
+        "size": statobjc.st_size,
+        "mtime": statobjc.st_mtime_ns,
+    }
+    if sources is not None:
+        record["sources"] = sources
+
+    update_manifest(folder, database, record)
+    servlogr.logrobjc.info(f"[{name}] Recorded {checksum} for {database} in the manifest")
+
+
+@dataclass(frozen=True)
+class Database:
+    dtbsfile: str
+    inode: int
+    size: int
+    mtime: int
+    checksum: str
+
+    @property
+    def stamp(self):
+        """
+        The checksum published in repomd.xml for the database, as recorded in the manifest, or
+        failing that, the identity of the file
+        """
+        return self.checksum or f"{self.inode}.{self.mtime}"
+
+
+def parse_filename(filename):
+    """
+    Return the branch, the repository type and the kind of database stored in a file named
+    like `mdapi-<branch>[-<repotype>]-<kind>.sqlite` or None if it is not such a file
+    """
+    if not filename.startswith("mdapi-") or not filename.endswith(".sqlite"):
+        return None
+
+    name, _, kind = filename[len("mdapi-") : -len(".sqlite")].rpartition("-")
+    if not name or kind not in KINDS:
+        return None
+
+    for repotype in REPOTYPES[:-1]:
+        if name.endswith(f"-{repotype}"):
+            return (name[: -len(repotype) - 1], repotype, kind)
+    return (name, None, kind)
+
+
+def scan_databases(folder, manifest):
+    """
+    Return the databases installed in the given directory keyed by branch, repository type and
+    kind, along with the checksums recorded for them in the given manifest
+    """
+    branches = {}
+    for entry in os.scandir(folder):
+        identity = parse_filename(entry.name)
+        if identity is None:
+            continue
+        brch, repotype, kind = identity
+        try:
+            statobjc = entry.stat()
+        except OSError:
+            # The file was replaced or removed while we were looking at it
+            continue
+        recorded = manifest.get(entry.name, {})
+        checksum = None
+        if recorded.get("inode") == statobjc.st_ino:
+            checksum = recorded.get("checksum")
+        branches.setdefault(brch, {}).setdefault(repotype, {})[kind] = Database(
+            entry.path, statobjc.st_ino, statobjc.st_size, statobjc.st_mtime_ns, checksum
+        )
+    return branches
+
+
+def unified_sources(repolist):
+    """
+    Return the identities of the primary databases of the given repositories of a branch, which
+    the unified database of the branch is built from, keyed by repository
+    """
+    return {
+        repotype or "release": repolist[repotype]["primary"].stamp
+        for repotype in REPOTYPES
+        if repolist.get(repotype, {}).get("primary")
+    }
 
 
 class compare_databases:
@@ -65,7 +453,11 @@ class compare_databases:
     def obtain_table_names(self, location):
         connobjc = sqlite3.connect(location)
         for name in connobjc.execute(OBTAIN_TABLE_NAMES):
-            if name[0] == "db_info":
+            # The statistics gathered by ANALYZE at ingestion are not part of the metadata
+            if name[0] == "db_info" or name[0].startswith("sqlite_"):
+                continue
+            # Neither are the tables derived from it, nor the shadow tables SQLite makes for them
+            if any(name[0] == table or name[0].startswith(f"{table}_") for table in DERIVED_TABLE_NAMES):  # noqa : E501
                 continue
             yield name[0]
         connobjc.close()
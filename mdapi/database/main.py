@@ -24,13 +24,17 @@ of Red Hat, Inc.
 import bz2
 import gzip
 import hashlib
+import io
+import json
 import lzma
 import os.path
 import re
 import shutil
 import tarfile
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree import ElementTree
 
 import pyzstd
@@ -40,7 +44,31 @@ from fedora_messaging.exceptions import ConnectionException, PublishReturned
 from mdapi_messages.messages import RepoUpdateV1
 
 from mdapi.confdata import servlogr, standard
-from mdapi.database.base import compare_databases, index_database
+from mdapi.database.base import (
+    REPOTYPES,
+    compare_databases,
+    index_database,
+    matches_manifest,
+    read_manifest,
+    record_manifest,
+    scan_databases,
+    unified_sources,
+    unify_databases,
+    update_manifest,
+)
+
+# The HTTP sessions of the ingest workers, one per thread as the sessions are not thread-safe
+sessions = threading.local()
+
+
+def obtain_session():
+    """
+    Return the HTTP session of the current thread, which keeps its connections to the servers
+    alive from a request to the next so that they are not set up again for every file
+    """
+    if not hasattr(sessions, "session"):
+        sessions.session = requests.Session()
+    return sessions.session
 
 
 def list_branches(status="current"):
@@ -51,7 +79,7 @@ def list_branches(status="current"):
     list_branches("frozen")  returns ['f41']
     """
     urlx = f"{standard.BODHI_URL}/releases/"
-    resp = requests.get(urlx, params={"state": status})  # noqa : S113
+    resp = obtain_session().get(urlx, params={"state": status})  # noqa : S113
     resp.raise_for_status()
     data = [
         item["branch"]
@@ -63,35 +91,149 @@ def list_branches(status="current"):
     return data
 
 
-def fetch_database(name, repmdurl, location):
+def obtain_hash(hashtype):
+    """
+    Return a new hash object of the type named in repomd.xml
+    """
+    # Old EPEL5 does not even know which version of SHA it is using...
+    if hashtype == "sha":
+        hashtype = "sha1"
+    return getattr(hashlib, hashtype)()
+
+
+def fetch_database(name, repmdurl, location, hashdata=None, hashtype=None):
+    """
+    Download the file at the given URL to the given location BUFFER_SIZE bytes at a time, hashing
+    them along the way to verify the file against the checksum published for it in repomd.xml if
+    one is provided, so that the file is never held in memory as a whole
+    """
     servlogr.logrobjc.info(f"[{name}] Downloading file {repmdurl} to {location}")
-    resp = requests.get(repmdurl, verify=True)  # noqa : S113
-    resp.raise_for_status()
-    with open(location, "wb") as filestrm:
-        filestrm.write(resp.content)
+    hashobjc = obtain_hash(hashtype) if hashdata else None
+    with obtain_session().get(repmdurl, verify=True, stream=True) as resp:  # noqa : S113
+        resp.raise_for_status()
+        with open(location, "wb") as filestrm:
+            for chunk in resp.iter_content(standard.BUFFER_SIZE):
+                filestrm.write(chunk)
+                if hashobjc:
+                    hashobjc.update(chunk)
+
+    if hashobjc and hashobjc.hexdigest() != hashdata:
+        # Raised as an OSError so that the repository is tried again like for any invalid stream
+        servlogr.logrobjc.error(f"[{name}] Checksum mismatch for {repmdurl}")
+        raise OSError(f"{repmdurl} does not match its {hashtype} checksum {hashdata}")
 
 
 def extract_database(name, arcvname, location):
+    """
+    Extract the database from the archive at the given location BUFFER_SIZE bytes at a time, so
+    that neither of them is ever held in memory as a whole
+    """
     servlogr.logrobjc.info(f"[{name}] Extracting {arcvname} to {location}")
+    strttime = time.monotonic()
     if arcvname.endswith(".xz"):
+        codec = "xz"
         with lzma.open(arcvname) as inp, open(location, "wb") as otptfile:
-            otptfile.write(inp.read())
+            shutil.copyfileobj(inp, otptfile, standard.BUFFER_SIZE)
     elif arcvname.endswith(".tar.gz"):
         with tarfile.open(arcvname) as tararchv:
             tararchv.extractall(path=location, filter="data")
+        return
     elif arcvname.endswith(".gz"):
+        codec = "gzip"
         with gzip.open(arcvname, "rb") as inp, open(location, "wb") as otptfile:
-            otptfile.write(inp.read())
+            shutil.copyfileobj(inp, otptfile, standard.BUFFER_SIZE)
     elif arcvname.endswith(".bz2"):
+        codec = "bzip2"
         with bz2.open(arcvname) as inp, open(location, "wb") as otptfile:
-            otptfile.write(inp.read())
+            shutil.copyfileobj(inp, otptfile, standard.BUFFER_SIZE)
     elif arcvname.endswith(".zst"):
-        with open(arcvname, "rb") as inp, open(location, "wb") as otptfile:
-            pyzstd.decompress_stream(inp, otptfile)
+        codec = "zstd"
+        with pyzstd.ZstdFile(arcvname) as inp, open(location, "wb") as otptfile:
+            shutil.copyfileobj(inp, otptfile, standard.BUFFER_SIZE)
     else:
         servlogr.logrobjc.error(f"Could not extract {arcvname}")
         raise NotImplementedError(arcvname)
 
+    duration = max(time.monotonic() - strttime, 1e-6)
+    arcvsize, size = os.path.getsize(arcvname), os.path.getsize(location)
+    servlogr.logrobjc.info(
+        f"[{name}] Extracted {arcvsize} bytes of {codec} into {size} bytes in {duration:.3f}s "
+        f"at {size / duration / 1024 / 1024:.1f} MiB/s"
+    )
+
+
+# Readers of the compressed databases, keyed by the suffix of the archive
+DECOMPRESSORS = {
+    ".xz": lzma.open,
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".zst": pyzstd.ZstdFile,
+}
+
+
+class HashedStream(io.RawIOBase):
+    """
+    Readable stream passing the bytes read from another one through, hashing them along the way
+    """
+
+    def __init__(self, stream, hashobjc):
+        self.stream = stream
+        self.hashobjc = hashobjc
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        if self.hashobjc:
+            self.hashobjc.update(data)
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def stream_database(name, repmdurl, location, hashdata, hashtype, arcvhash=None, arcvtype=None):
+    """
+    Download the archive at the given URL, extract the database from it and write it to the given
+    location in a single pass of BUFFER_SIZE chunks, verifying the archive and the database against
+    their checksums published in repomd.xml along the way, so that neither the archive nor the
+    database is ever held in memory or written to disk on its own
+    """
+    servlogr.logrobjc.info(f"[{name}] Streaming {repmdurl} to {location}")
+    suffix = os.path.splitext(repmdurl)[1]
+    if suffix not in DECOMPRESSORS:
+        servlogr.logrobjc.error(f"Could not extract {repmdurl}")
+        raise NotImplementedError(repmdurl)
+
+    strttime = time.monotonic()
+    arcvobjc = obtain_hash(arcvtype) if arcvhash else None
+    hashobjc = obtain_hash(hashtype)
+    with obtain_session().get(repmdurl, verify=True, stream=True) as resp:  # noqa : S113
+        resp.raise_for_status()
+        # Undo any encoding of the transfer itself, the archive is what the checksum is about
+        resp.raw.decode_content = True
+        arcvstrm = HashedStream(resp.raw, arcvobjc)
+        with DECOMPRESSORS[suffix](arcvstrm) as inp, open(location, "wb") as otptfile:
+            while chunk := inp.read(standard.BUFFER_SIZE):
+                otptfile.write(chunk)
+                hashobjc.update(chunk)
+        # The decompressors can stop short of the end of the archive, which the checksum covers
+        while arcvstrm.read(standard.BUFFER_SIZE):
+            pass
+
+    if arcvobjc and arcvobjc.hexdigest() != arcvhash:
+        servlogr.logrobjc.error(f"[{name}] Checksum mismatch for {repmdurl}")
+        raise OSError(f"{repmdurl} does not match its {arcvtype} checksum {arcvhash}")
+    if hashobjc.hexdigest() != hashdata:
+        servlogr.logrobjc.error(f"[{name}] Checksum mismatch for the database in {repmdurl}")
+        raise OSError(f"The database in {repmdurl} does not match its {hashtype} checksum {hashdata}")  # noqa : E501
+
+    duration = max(time.monotonic() - strttime, 1e-6)
+    size = os.path.getsize(location)
+    servlogr.logrobjc.info(
+        f"[{name}] Streamed {size} bytes of database in {duration:.3f}s "
+        f"at {size / duration / 1024 / 1024:.1f} MiB/s"
+    )
+
 
 def publish_changes(name, packages, repmdurl):
     servlogr.logrobjc.info(f"[{name}] Publishing differences to Fedora Messaging bus")
@@ -131,7 +273,7 @@ def install_database(name, srce, dest):
     shutil.move(srce, dest)
 
 
-def needs_update(loclfile, srcehash, hashtype):
+def needs_update(loclfile, srcehash, hashtype, recorded=None):
     """
     Compare SHA of the local and remote file
     Return True if our local file needs to be updated
@@ -141,48 +283,85 @@ def needs_update(loclfile, srcehash, hashtype):
         # then obviously it has "changed"...
         return True
 
-    # Old EPEL5 does not even know which version of SHA it is using...
-    if hashtype == "sha":
-        hashtype = "sha1"
+    # The file recorded in the manifest along with the checksum is still in place, as it was
+    if recorded and matches_manifest(recorded, loclfile, f"{hashtype}:{srcehash}"):
+        return False
 
-    hashdata = getattr(hashlib, hashtype)()
+    servlogr.logrobjc.info(f"Hashing {loclfile} as the manifest does not describe it")
+    hashdata = obtain_hash(hashtype)
     with open(loclfile, "rb") as fileobjc:
-        hashdata.update(fileobjc.read())
+        while chunk := fileobjc.read(standard.BUFFER_SIZE):
+            hashdata.update(chunk)
     loclhash = hashdata.hexdigest()
     if loclhash != srcehash:
         return True
     return False
 
 
+def repomd_validators(recorded, manifest):
+    """
+    Return the headers asking for the repomd.xml of a repository only if it changed since it was
+    recorded in the manifest, unless any of the databases installed from it is missing or was
+    replaced since then
+    """
+    for database in recorded.get("databases", []):
+        destfile = os.path.join(standard.DB_FOLDER, database)
+        loclrcrd = manifest.get(database, {})
+        if not os.path.isfile(destfile) or not matches_manifest(
+            loclrcrd, destfile, loclrcrd.get("checksum")
+        ):
+            return {}
+
+    headers = {}
+    if recorded.get("etag"):
+        headers["If-None-Match"] = recorded["etag"]
+    if recorded.get("last-modified"):
+        headers["If-Modified-Since"] = recorded["last-modified"]
+    return headers
+
+
 def process_repo(repo):
     """
     Retrieve the repo metadata at the given URL and store them using the provided name.
     """
     urlx, name = repo
     repmdurl = f"{urlx}/repomd.xml"
-    response = requests.get(repmdurl, verify=True)  # noqa : S113
+    manifest = read_manifest(standard.DB_FOLDER)
+    repomd = f"mdapi-{name}-repomd.xml"
+    headers = repomd_validators(manifest.get(repomd, {}), manifest)
+    response = obtain_session().get(repmdurl, headers=headers, verify=True)  # noqa : S113
+    if response.status_code == 304:
+        servlogr.logrobjc.info(f"[{name}] No change detected from {repmdurl} since it was recorded")
+        return
     if not response:
         servlogr.logrobjc.error(f"[{name}] Failed to obtain {repmdurl} - {response}")
         return
 
-    # Parse the XML document and get a list of locations and their SHAsum
+    # Parse the XML document and get a list of locations and their SHAsum, of the database and of
+    # the archive it is published in
     filelist = (
         (
             node.find("repo:location", standard.repomd_xml_namespace),
             node.find("repo:open-checksum", standard.repomd_xml_namespace),
+            node.find("repo:checksum", standard.repomd_xml_namespace),
         )
         for node in ElementTree.fromstring(response.text)  # noqa : S314
     )
 
     # Extract out the attributes that we are really interested in
     filelist = (
-        (fobj.attrib["href"].replace("repodata/", ""), sobj.text, sobj.attrib["type"])
-        for fobj, sobj in filelist
+        (
+            fobj.attrib["href"].replace("repodata/", ""),
+            sobj.text,
+            sobj.attrib["type"],
+            (aobj.text, aobj.attrib["type"]) if aobj is not None else (None, None),
+        )
+        for fobj, sobj, aobj in filelist
         if fobj is not None and sobj is not None
     )
 
     # Filter down to only SQLite3 databases
-    filelist = ((fobj, sobj, tobj) for fobj, sobj, tobj in filelist if ".sqlite" in fobj)
+    filelist = (item for item in filelist if ".sqlite" in item[0])
 
     # We need to ensure the primary database comes first, so we can build a PKEY cache
     prmyfrst = lambda item: "primary" not in item[0]  # noqa
@@ -195,7 +374,8 @@ def process_repo(repo):
     if not filelist:
         servlogr.logrobjc.warning(f"No SQLite database could be found in {urlx}")
 
-    for filename, hashdata, hashtype in filelist:
+    databases = []
+    for filename, hashdata, hashtype, (arcvhash, arcvtype) in filelist:
         repmdurl = f"{urlx}/{filename}"
 
         # First, determine if the file has changed by comparing hash
@@ -209,9 +389,14 @@ def process_repo(repo):
 
         # Have we downloaded this before?
         # Did it change?
+        databases.append(database)
         destfile = os.path.join(standard.DB_FOLDER, database)
-        if not needs_update(destfile, hashdata, hashtype):
+        checksum = f"{hashtype}:{hashdata}"
+        recorded = manifest.get(database, {})
+        if not needs_update(destfile, hashdata, hashtype, recorded):
             servlogr.logrobjc.info(f"[{name}] No change detected from {repmdurl}")
+            if not matches_manifest(recorded, destfile, checksum):
+                record_manifest(name, destfile, checksum)
             continue
 
         # Creating temporary directories with formatted names to remove them later easily, if needed
@@ -220,9 +405,8 @@ def process_repo(repo):
         # If it has changed, then download it and move it into place
         with tempfile.TemporaryDirectory(**tempargs) as workdrct:
             tempdtbs = os.path.join(workdrct, database)
-            archname = os.path.join(workdrct, filename)
-            fetch_database(name, repmdurl, archname)
-            extract_database(name, archname, tempdtbs)
+            # An archive of an unknown kind is turned down before anything gets downloaded
+            stream_database(name, repmdurl, tempdtbs, hashdata, hashtype, arcvhash, arcvtype)
             index_database(name, tempdtbs)
             if standard.PUBLISH_CHANGES:
                 packages = compare_databases(name, tempdtbs, destfile, cacA, cacB).main()
@@ -230,6 +414,104 @@ def process_repo(repo):
             else:
                 servlogr.logrobjc.warning(f"[{name}] Not publishing to Fedora Messaging bus - Not comparing databases")  # noqa : E501
             install_database(name, tempdtbs, destfile)
+            record_manifest(name, destfile, checksum)
+
+    # Only once all the databases are in place, so that a failure gets the repomd.xml fetched again
+    update_manifest(
+        standard.DB_FOLDER,
+        repomd,
+        {
+            "etag": response.headers.get("ETag"),
+            "last-modified": response.headers.get("Last-Modified"),
+            "databases": databases,
+        },
+    )
+
+
+def ingest_repository(repo):
+    """
+    Process the given repository, trying again a few times if it fails with an OSError, and
+    return None if it succeeded or the error it failed with, so that a failing repository does not
+    hold the others back
+    """
+    urlx, name = repo
+    qant = 0
+    while True:
+        qant += 1
+        try:
+            process_repo(repo)
+            return None
+        except OSError as excp:
+            if qant == 4:
+                servlogr.logrobjc.error(f"[{name}] Giving up on {urlx} after {qant} attempts - {excp}")  # noqa : E501
+                return excp
+            # Most often due to an invalid stream, so let us try again
+            servlogr.logrobjc.warning(f"[{name}] Failed to process {urlx} - {excp} - Retrying")
+            time.sleep(standard.CRON_SLEEP)
+        except Exception as excp:
+            servlogr.logrobjc.exception(f"[{name}] Failed to process {urlx}")
+            return excp
+
+
+def ingest_repositories(repolist):
+    """
+    Process the given repositories, INGEST_WORKERS of them at once since most of the time goes into
+    waiting on the network and decompressing the databases, and return the names of those that
+    failed
+    """
+    strttime = time.monotonic()
+    with ThreadPoolExecutor(standard.INGEST_WORKERS, thread_name_prefix="mdapi-ingest") as executor:
+        outcomes = list(executor.map(ingest_repository, repolist))
+
+    failures = [name for (_, name), excp in zip(repolist, outcomes) if excp]
+    servlogr.logrobjc.info(
+        f"Processed {len(repolist) - len(failures)} of {len(repolist)} repositories in "
+        f"{time.monotonic() - strttime:.3f}s with {standard.INGEST_WORKERS} workers"
+    )
+    if failures:
+        servlogr.logrobjc.error(f"Could not process {', '.join(failures)}")
+    return failures
+
+
+def unify_branches():
+    """
+    Consolidate the primary databases of all the repositories of every branch having more than one
+    into a single database, unless none of them changed since it was last built
+    """
+    manifest = read_manifest(standard.DB_FOLDER)
+    branches = scan_databases(standard.DB_FOLDER, manifest)
+    for brch, repolist in sorted(branches.items()):
+        sources = unified_sources(repolist)
+        if len(sources) < 2:
+            continue
+
+        database = f"mdapi-{brch}-unified.sqlite"
+        destfile = os.path.join(standard.DB_FOLDER, database)
+        recorded = manifest.get(database, {})
+        if (
+            recorded.get("sources") == sources
+            and os.path.isfile(destfile)
+            and matches_manifest(recorded, destfile, recorded["checksum"])
+        ):
+            servlogr.logrobjc.info(f"[{brch}] No change detected for {database}")
+            continue
+
+        checksum = hashlib.sha256(json.dumps(sources, sort_keys=True).encode()).hexdigest()
+        tempargs = dict(prefix="mdapi-tempdrct-", dir=standard.DB_FOLDER)
+        with tempfile.TemporaryDirectory(**tempargs) as workdrct:
+            tempdtbs = os.path.join(workdrct, database)
+            unify_databases(
+                brch,
+                tempdtbs,
+                [
+                    (repotype or "release", repolist[repotype]["primary"].dtbsfile)
+                    for repotype in REPOTYPES
+                    if repolist.get(repotype, {}).get("primary")
+                ],
+            )
+            index_database(brch, tempdtbs)
+            install_database(brch, tempdtbs, destfile)
+            record_manifest(brch, destfile, f"sha256:{checksum}", sources)
 
 
 def index_repositories():
@@ -291,18 +573,8 @@ def index_repositories():
     # Finish with the koji repo
     repolist.append((f"{standard.KOJI_REPO}/rawhide/latest/x86_64/repodata/", "koji"))
 
-    # In serial
-    for repo in repolist:
-        loop = True
-        qant = 0
-        while loop:
-            qant += 1
-            try:
-                process_repo(repo)
-                loop = False
-            except OSError:
-                if qant == 4:
-                    raise
-                # Most often due to an invalid stream, so let us try again
-                time.sleep(standard.CRON_SLEEP)
-                process_repo(repo)
+    failures = ingest_repositories(repolist)
+    if standard.UNIFIED_BRANCHES:
+        unify_branches()
+    if failures:
+        raise RuntimeError(f"Could not process {', '.join(failures)}")
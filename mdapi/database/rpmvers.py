@@ -0,0 +1,90 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+import string
+
+"""
+Every version is turned into a sequence of tokens which sort in the same order as rpmvercmp()
+sorts what they stand for - a tilde sorts before the end of the version, which sorts before a
+caret, which sorts before a run of letters, which sorts before a run of digits.  The letters are
+terminated by a character sorting before all of them and the digits are stripped of their leading
+zeros and prefixed with their count, so that the keys compare as plain strings.
+"""
+TILDE, END, CARET, ALPHA, NUMBER = "0", "1", "2", "3", "4"
+
+ALPHA_END = "!"
+
+ALPHABETS = frozenset(string.ascii_letters)
+
+DIGITS = frozenset(string.digits)
+
+
+def _number(digits):
+    digits = digits.lstrip("0")
+    return f"{NUMBER}{len(digits):02d}{digits}"
+
+
+def version_key(version):
+    """
+    Return the sortable key of a version or release string, terminated by the end token
+    """
+    tokens = []
+    indx, size = 0, len(version or "")
+    while indx < size:
+        char = version[indx]
+        if char == "~":
+            tokens.append(TILDE)
+            indx += 1
+        elif char == "^":
+            tokens.append(CARET)
+            indx += 1
+        elif char in DIGITS or char in ALPHABETS:
+            kind = DIGITS if char in DIGITS else ALPHABETS
+            last = indx
+            while last < size and version[last] in kind:
+                last += 1
+            segment = version[indx:last]
+            tokens.append(_number(segment) if kind is DIGITS else f"{ALPHA}{segment}{ALPHA_END}")
+            indx = last
+        else:
+            # Every other character only separates the segments
+            indx += 1
+    tokens.append(END)
+    return "".join(tokens)
+
+
+def evr_key(epoch, version, release):
+    """
+    Return a string that sorts the packages by epoch, version and release like RPM does, so that
+    the latest one can be found with an index
+    """
+    epoch = str(epoch or "")
+    return _number(epoch if epoch.isdigit() else "") + version_key(version) + version_key(release)
+
+
+def source_name(rpm_sourcerpm):
+    """
+    Return the name of the source package in the file name of a src.rpm, which ends with its
+    version and release
+    """
+    return rpm_sourcerpm.rsplit("-", 2)[0] if rpm_sourcerpm else None
@@ -25,7 +25,323 @@ of Red Hat, Inc.
 Queries used by the database populating backend
 """
 
-INDEX_DATABASE = "CREATE INDEX packageSource ON packages (rpm_sourcerpm)"
+# Tables holding the dependency relations of the packages in the primary databases
+RELATIONS = [
+    "conflicts",
+    "obsoletes",
+    "provides",
+    "requires",
+    "enhances",
+    "recommends",
+    "suggests",
+    "supplements",
+]
+
+"""
+Columns derived from the others at ingestion, as the table, the column and the SQL expression
+computing it - `evr_key` sorts the packages by epoch, version and release like RPM does and
+`source_name` parses the name of the source package out of the src.rpm, both are functions
+registered on the connection
+"""
+DERIVED_COLUMNS = {
+    "primary": [
+        ("packages", "evr_key", "evr_key(epoch, version, release)"),
+        ("packages", "rpm_sourcename", "source_name(rpm_sourcerpm)"),
+    ],
+}
+
+"""
+Every file of the packages on its own row, keyed by its path so that the packages shipping a file
+or the files under a directory are found with a seek into the table - createrepo_c stores the
+names of the files of every directory joined with slashes, build_filepath splits them
+"""
+CREATE_FILEPATH = """
+    CREATE TABLE filepath (
+        path TEXT,
+        pkgKey INTEGER,
+        PRIMARY KEY (path, pkgKey)
+    ) WITHOUT ROWID
+"""
+
+FILEPATH_ROWS = "SELECT pkgKey, dirname, filenames FROM filelist"
+
+FILL_FILEPATH = "INSERT OR IGNORE INTO filepath VALUES (?, ?)"
+
+"""
+Full-text index over the names, summaries and descriptions of the packages, it reads them from the
+packages table rather than keeping a copy of them
+"""
+CREATE_PACKAGES_FTS = """
+    CREATE VIRTUAL TABLE packages_fts USING fts5 (
+        name,
+        summary,
+        description,
+        content = 'packages',
+        content_rowid = 'pkgKey'
+    )
+"""
+
+FILL_PACKAGES_FTS = "INSERT INTO packages_fts (packages_fts) VALUES ('rebuild')"
+
+"""
+Every distinct package name split into the sequences of three characters it is made of, so that
+the names sharing most of them with a misspelled or partial one can be found
+"""
+CREATE_PACKAGES_TRIGRAM = """
+    CREATE VIRTUAL TABLE packages_trigram USING fts5 (
+        name,
+        tokenize = 'trigram'
+    )
+"""
+
+FILL_PACKAGES_TRIGRAM = "INSERT INTO packages_trigram (name) SELECT DISTINCT name FROM packages"
+
+"""
+The graph of the runtime dependencies between the packages, one node per package name with the
+nodes of the packages providing its requirements as an array of unsigned integers and the
+requirements that no package of the repository provides, which are to be looked up in the others
+- it is filled by `build_depgraph` rather than by a query
+"""
+CREATE_DEPGRAPH = """
+    CREATE TABLE depgraph (
+        node INTEGER PRIMARY KEY,
+        name TEXT UNIQUE,
+        edges BLOB,
+        redges BLOB,
+        unresolved TEXT
+    )
+"""
+
+"""
+The temporary tables the dependency graph is compiled in - the nodes are numbered after the order
+of the package names, the providers of the capabilities tell the package named after the
+capability apart and the requirements leave out the features of RPM itself and the rich
+dependencies, which are not packages to pull in
+"""
+DEPGRAPH_TABLES = {
+    "depnodes": (
+        "CREATE TEMP TABLE depnodes (node INTEGER PRIMARY KEY, name TEXT UNIQUE)",
+        "INSERT INTO depnodes (name) SELECT DISTINCT name FROM packages ORDER BY name",
+    ),
+    "depproviders": (
+        """
+        CREATE TEMP TABLE depproviders (
+            capability TEXT,
+            node INTEGER,
+            named INTEGER,
+            PRIMARY KEY (capability, node)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR IGNORE INTO depproviders
+        SELECT v.name, n.node, v.name = n.name FROM provides v
+        JOIN packages p ON p.pkgKey = v.pkgKey JOIN depnodes n ON n.name = p.name
+        UNION ALL
+        SELECT f.name, n.node, f.name = n.name FROM files f
+        JOIN packages p ON p.pkgKey = f.pkgKey JOIN depnodes n ON n.name = p.name
+        """,
+    ),
+    "deprequired": (
+        """
+        CREATE TEMP TABLE deprequired (
+            node INTEGER,
+            capability TEXT,
+            PRIMARY KEY (node, capability)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR IGNORE INTO deprequired
+        SELECT n.node, r.name FROM requires r
+        JOIN packages p ON p.pkgKey = r.pkgKey JOIN depnodes n ON n.name = p.name
+        WHERE substr(r.name, 1, 7) <> 'rpmlib(' AND substr(r.name, 1, 1) <> '('
+        """,
+    ),
+    "depedges": (
+        """
+        CREATE TEMP TABLE depedges (
+            node INTEGER,
+            provider INTEGER,
+            PRIMARY KEY (node, provider)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR IGNORE INTO depedges
+        SELECT q.node, v.node FROM deprequired q
+        JOIN depproviders v ON v.capability = q.capability
+        WHERE v.node <> q.node AND (
+            v.named OR NOT EXISTS (
+                SELECT 1 FROM depproviders w WHERE w.capability = q.capability AND w.named
+            )
+        )
+        """,
+    ),
+}
+
+DEPGRAPH_INDEX_REDGES = "CREATE INDEX temp.depedgesProvider ON depedges (provider, node)"
+
+DROP_TEMP_TABLE = "DROP TABLE temp.{table}"
+
+"""
+The nodes, the edges, the reverse edges and the unresolved requirements of the dependency graph,
+every one of them in the order of the nodes
+"""
+DEPGRAPH_NODES = "SELECT node, name FROM depnodes ORDER BY node"
+
+DEPGRAPH_EDGES = "SELECT node, provider FROM depedges ORDER BY node, provider"
+
+DEPGRAPH_REDGES = "SELECT provider, node FROM depedges ORDER BY provider, node"
+
+DEPGRAPH_UNRESOLVED = """
+    SELECT q.node, q.capability FROM deprequired q
+    WHERE NOT EXISTS (SELECT 1 FROM depproviders v WHERE v.capability = q.capability)
+    ORDER BY q.node, q.capability
+"""
+
+FILL_DEPGRAPH = "INSERT INTO depgraph VALUES (?, ?, ?, ?, ?)"
+
+"""
+Tables derived from the others at ingestion, as the table they are built from, the name of the
+table and the queries creating and filling it - they are left out of the comparison of the
+databases along with the tables SQLite creates for them
+"""
+DERIVED_TABLES = {
+    "primary": [
+        ("packages", "packages_fts", CREATE_PACKAGES_FTS, FILL_PACKAGES_FTS),
+        ("packages", "packages_trigram", CREATE_PACKAGES_TRIGRAM, FILL_PACKAGES_TRIGRAM),
+        ("requires", "depgraph", CREATE_DEPGRAPH, None),
+    ],
+    "filelists": [
+        ("filelist", "filepath", CREATE_FILEPATH, None),
+    ],
+}
+
+"""
+The packages of all the repositories of a branch in one table, along with the repository they come
+from and its rank in the order in which the repositories are looked up - the pkgKey of a package
+is the one it has in the primary database of its repository, which has its relations
+"""
+CREATE_UNIFIED_PACKAGES = """
+    CREATE TABLE packages (
+        repo TEXT,
+        rank INTEGER,
+        pkgKey INTEGER,
+        pkgId TEXT,
+        name TEXT,
+        rpm_sourcerpm TEXT,
+        epoch TEXT,
+        version TEXT,
+        release TEXT,
+        arch TEXT,
+        summary TEXT,
+        description TEXT,
+        url TEXT,
+        evr_key TEXT,
+        rpm_sourcename TEXT
+    )
+"""
+
+ATTACH_SOURCE = "ATTACH DATABASE ? AS source"
+
+DETACH_SOURCE = "DETACH DATABASE source"
+
+FILL_UNIFIED_PACKAGES = """
+    INSERT INTO packages
+    SELECT
+        ?,
+        ?,
+        pkgKey,
+        pkgId,
+        name,
+        rpm_sourcerpm,
+        epoch,
+        version,
+        release,
+        arch,
+        summary,
+        description,
+        url,
+        evr_key(epoch, version, release),
+        source_name(rpm_sourcerpm)
+    FROM source.packages
+"""
+
+"""
+The packages requiring others through the requirements left unresolved in their own repository,
+which the closure resolves in the other repositories of the branch, compiled along with the
+unified packages out of the dependency graphs of the repositories - the name is that of the
+package required and the dependent one comes from the given repository
+"""
+CREATE_CROSSING = "CREATE TABLE crossing (name TEXT, dependent TEXT, repo TEXT)"
+
+FILL_CROSSING = "INSERT INTO crossing VALUES (?, ?, ?)"
+
+CREATE_CAPABILITIES = "CREATE TEMP TABLE capabilities (name TEXT PRIMARY KEY)"
+
+FILL_CAPABILITIES = "INSERT INTO capabilities VALUES (?)"
+
+SOURCE_DEPGRAPH_COLUMNS = "SELECT name FROM pragma_table_info('depgraph', 'source')"
+
+SOURCE_UNRESOLVED = """
+    SELECT
+        name,
+        unresolved
+    FROM source.depgraph
+    WHERE unresolved != '[]'
+"""
+
+SOURCE_PROVIDERS = """
+    SELECT v.name, p.name FROM source.provides v JOIN source.packages p ON p.pkgKey = v.pkgKey
+    WHERE v.name IN (SELECT name FROM capabilities)
+    UNION
+    SELECT f.name, p.name FROM source.files f JOIN source.packages p ON p.pkgKey = f.pkgKey
+    WHERE f.name IN (SELECT name FROM capabilities)
+"""
+
+"""
+Indices created at ingestion for every kind of database, as the table, the name of the index and
+its columns - an index is skipped when the table is missing or when createrepo_c already created
+one over the same columns
+"""
+INDICES = {
+    "primary": [
+        ("packages", "packageSource", "rpm_sourcerpm"),
+        ("packages", "packageEvr", "name, evr_key"),
+        ("packages", "packageSourceName", "rpm_sourcename"),
+        *((relation, f"{relation}Name", "name") for relation in RELATIONS),
+        ("files", "filesName", "name"),
+    ],
+    "filelists": [
+        ("packages", "packageId", "pkgId"),
+        ("filelist", "filelistKey", "pkgKey"),
+    ],
+    "other": [
+        ("packages", "packageId", "pkgId"),
+        ("changelog", "changelogDate", "pkgKey, date"),
+    ],
+    "unified": [
+        ("packages", "unifiedName", "name, rank, evr_key"),
+        ("packages", "unifiedSourceName", "rpm_sourcename, rank"),
+        ("crossing", "crossingName", "name"),
+    ],
+}
+
+ADD_COLUMN = "ALTER TABLE {table} ADD COLUMN {column} TEXT"
+
+FILL_COLUMN = "UPDATE {table} SET {column} = {value}"
+
+CREATE_INDEX = "CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})"
+
+ANALYZE_DATABASE = "ANALYZE"
+
+OBTAIN_INDEX_COLUMNS = """
+    SELECT
+        m.tbl_name,
+        m.name,
+        i.seqno,
+        i.name
+    FROM sqlite_master m, pragma_index_info(m.name) i
+    WHERE m.type = 'index'
+"""
 
 OBTAIN_TABLE_NAMES = "SELECT name FROM sqlite_master WHERE type='table'"
 
@@ -108,6 +424,23 @@ queries = {
 Queries used by the mdapi web service
 """
 
+"""
+Orderings of the packages from the latest to the oldest, to be formatted in as `order` with the
+alias of the packages table - the sortable key is missing from the databases indexed before it
+was introduced, which are ordered by the text of their epoch, version and release instead
+"""
+ORDER_BY_EVR_KEY = "{0}evr_key DESC"
+
+ORDER_BY_EVR_TEXT = "{0}epoch DESC, {0}version DESC, {0}release DESC"
+
+GET_SCHEMA = """
+    SELECT
+        m.name,
+        c.name
+    FROM sqlite_master m, pragma_table_info(m.name) c
+    WHERE m.type = 'table'
+"""
+
 GET_PACKAGE = """
     SELECT
         pkgKey,
@@ -123,11 +456,111 @@ GET_PACKAGE = """
         url
     FROM packages
     WHERE name = ?
-    ORDER BY epoch DESC, version DESC, release DESC
+    ORDER BY {order}
+    LIMIT 1
+"""
+
+"""
+The packages of a batch of names, the first row of every name is the one GET_PACKAGE returns
+"""
+GET_PACKAGES = """
+    SELECT
+        pkgKey,
+        pkgId,
+        name,
+        rpm_sourcerpm,
+        epoch,
+        version,
+        release,
+        arch,
+        summary,
+        description,
+        url
+    FROM packages
+    WHERE name IN ({names})
+    ORDER BY name, {order}
+"""
+
+"""
+Orderings of the packages of the database consolidating the repositories of a branch, from the
+first repository having them as the lookup in every repository finds them, or from the latest of
+all of them, to be formatted in as `order` with the criteria to sort the packages of the same
+repository by before their version
+"""
+ORDER_BY_RANK = "rank, {0}evr_key DESC"
+
+ORDER_BY_NEWEST = "{0}evr_key DESC, rank"
+
+# The package named after the source package comes before the others built from it
+NAMED_AFTER_SOURCE = "name = rpm_sourcename DESC, "
+
+"""
+The package of the given name in the database consolidating the repositories of a branch, in
+the given repository or in any of them if none is given
+"""
+GET_UNIFIED_PACKAGE = """
+    SELECT
+        repo,
+        pkgKey,
+        pkgId,
+        name,
+        rpm_sourcerpm,
+        epoch,
+        version,
+        release,
+        arch,
+        summary,
+        description,
+        url
+    FROM packages
+    WHERE name = ? AND repo = coalesce(?, repo)
+    ORDER BY {order}
+    LIMIT 1
+"""
+
+GET_UNIFIED_PACKAGES = """
+    SELECT
+        repo,
+        pkgKey,
+        pkgId,
+        name,
+        rpm_sourcerpm,
+        epoch,
+        version,
+        release,
+        arch,
+        summary,
+        description,
+        url
+    FROM packages
+    WHERE name IN ({names})
+    ORDER BY name, rank, evr_key DESC
 """
 
-GET_PACKAGE_INFO = """
+GET_UNIFIED_PACKAGE_BY_SOURCE_NAME = """
     SELECT
+        repo,
+        pkgKey,
+        pkgId,
+        name,
+        rpm_sourcerpm,
+        epoch,
+        version,
+        release,
+        arch,
+        summary,
+        description,
+        url
+    FROM packages
+    WHERE rpm_sourcename = ? AND repo = coalesce(?, repo)
+    ORDER BY {order}
+    LIMIT 1
+"""
+
+GET_PACKAGE_RELATION = """
+    SELECT
+        '{0}',
+        NULL,
         rowid,
         pkgKey,
         name,
@@ -135,15 +568,34 @@ GET_PACKAGE_INFO = """
         version,
         release,
         flags
-    FROM {}
-    WHERE pkgKey = ?
+    FROM {0}
+    WHERE pkgKey IN ({{keys}})
 """
 
-GET_CO_PACKAGE = """
-    SELECT DISTINCT(name)
+GET_CO_PACKAGE_RELATION = """
+    SELECT DISTINCT
+        'co-packages',
+        rpm_sourcerpm,
+        NULL,
+        NULL,
+        name,
+        NULL,
+        NULL,
+        NULL,
+        NULL
     FROM packages
-    WHERE rpm_sourcerpm = ?
+    WHERE rpm_sourcerpm IN ({srcs})
+"""
+
+"""
+All the relations of a batch of packages and the packages built from the same src.rpm in one go,
+each row is tagged with the relation it belongs to and, for the latter, with the src.rpm.  The
+placeholders for the pkgKeys and the rpm_sourcerpms are to be formatted in as `keys` and `srcs`
+and the pkgKeys are bound once per relation, followed by the rpm_sourcerpms.
 """
+GET_PACKAGE_RELATIONS = "UNION ALL".join(
+    [GET_PACKAGE_RELATION.format(relation) for relation in RELATIONS] + [GET_CO_PACKAGE_RELATION]
+)
 
 GET_PACKAGE_BY_SRC = """
     SELECT
@@ -160,7 +612,30 @@ GET_PACKAGE_BY_SRC = """
         url
     FROM packages
     WHERE rpm_sourcerpm LIKE ?
-    ORDER BY epoch DESC, version DESC, release DESC
+    ORDER BY {order}
+"""
+
+"""
+The package built from the given source package, the one named after it if there is one, else
+the latest of them
+"""
+GET_PACKAGE_BY_SOURCE_NAME = """
+    SELECT
+        pkgKey,
+        pkgId,
+        name,
+        rpm_sourcerpm,
+        epoch,
+        version,
+        release,
+        arch,
+        summary,
+        description,
+        url
+    FROM packages
+    WHERE rpm_sourcename = ?
+    ORDER BY name = rpm_sourcename DESC, evr_key DESC
+    LIMIT 1
 """
 
 GET_PACKAGE_BY = """
@@ -177,9 +652,9 @@ GET_PACKAGE_BY = """
         p.description,
         p.url
     FROM packages p
-    JOIN {} t ON t.pkgKey = p.pkgKey
+    JOIN {0} t ON t.pkgKey = p.pkgKey
     WHERE t.name = ?
-    ORDER BY p.epoch DESC, p.version DESC, p.release DESC
+    ORDER BY {order}
 """
 
 GET_FILES = """
@@ -205,3 +680,197 @@ GET_CHANGELOGS = """
     WHERE c.pkgKey = p.pkgKey
     ORDER BY c.date DESC
 """
+
+"""
+Keyset pagination of the files and the changelogs, the rowid breaks the ties so that the cursor
+always points at a single row
+"""
+
+GET_FILES_PAGE = """
+    SELECT
+        f.rowid,
+        f.pkgKey,
+        f.dirname,
+        f.filenames,
+        f.filetypes
+    FROM filelist f
+    JOIN packages p ON p.pkgId = ?
+    WHERE f.pkgKey = p.pkgKey AND f.rowid > ?
+    ORDER BY f.rowid
+    LIMIT ?
+"""
+
+GET_CHANGELOGS_PAGE = """
+    SELECT
+        c.rowid,
+        c.pkgKey,
+        c.author,
+        c.changelog,
+        c.date
+    FROM changelog c
+    JOIN packages p ON p.pkgId = ?
+    WHERE c.pkgKey = p.pkgKey AND c.date >= ? AND (c.date, c.rowid) < (?, ?)
+    ORDER BY c.date DESC, c.rowid DESC
+    LIMIT ?
+"""
+
+"""
+The packages shipping a file, or any file under a directory, in the filelists databases and the
+packages they stand for in the primary databases
+"""
+
+GET_FILE_OWNERS = """
+    SELECT
+        f.path,
+        p.pkgId
+    FROM filepath f
+    JOIN packages p ON p.pkgKey = f.pkgKey
+    WHERE f.path = ?
+    ORDER BY f.path
+    LIMIT ?
+"""
+
+GET_FILE_OWNERS_UNDER = """
+    SELECT
+        f.path,
+        p.pkgId
+    FROM filepath f
+    JOIN packages p ON p.pkgKey = f.pkgKey
+    WHERE f.path > ? AND f.path < ?
+    ORDER BY f.path
+    LIMIT ?
+"""
+
+GET_PACKAGES_BY_ID = """
+    SELECT
+        pkgId,
+        name,
+        epoch,
+        version,
+        release,
+        arch
+    FROM packages
+    WHERE pkgId IN ({ids})
+"""
+
+GET_PACKAGE_NAMES = """
+    SELECT DISTINCT
+        name
+    FROM packages
+    WHERE name IN ({names})
+"""
+
+"""
+The packages matching a full-text query, the best first - a match in the name weighs more than one
+in the summary, which weighs more than one in the description
+"""
+SEARCH_PACKAGES = """
+    SELECT
+        p.name,
+        p.summary,
+        p.epoch,
+        p.version,
+        p.release,
+        p.arch,
+        bm25(packages_fts, 10.0, 5.0, 1.0) AS rank
+    FROM packages_fts
+    JOIN packages p ON p.pkgKey = packages_fts.rowid
+    WHERE packages_fts MATCH ?
+    ORDER BY rank, p.pkgKey
+    LIMIT ? OFFSET ?
+"""
+
+"""
+The package names sharing the most sequences of three characters with the given ones and those
+starting with a fragment too short to have any, whatever the case of their ASCII letters as the
+sequences are matched
+"""
+SUGGEST_NAMES = """
+    SELECT
+        name
+    FROM packages_trigram
+    WHERE packages_trigram MATCH ?
+    ORDER BY rank
+    LIMIT ?
+"""
+
+SUGGEST_NAMES_PREFIX = """
+    SELECT DISTINCT
+        name
+    FROM packages
+    WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE
+    ORDER BY name
+    LIMIT ?
+"""
+
+SUGGEST_NAMES_FROM = """
+    SELECT DISTINCT
+        name
+    FROM packages
+    WHERE name >= ? COLLATE NOCASE
+    ORDER BY name
+    LIMIT ?
+"""
+
+"""
+The nodes of the dependency graph of the given names or node numbers and the packages providing
+the given capabilities, as packages or as files
+"""
+
+GET_GRAPH_NODES = """
+    SELECT
+        node,
+        name,
+        edges,
+        unresolved
+    FROM depgraph
+    WHERE name IN ({names})
+"""
+
+GET_GRAPH_NAMES = """
+    SELECT
+        node,
+        name
+    FROM depgraph
+    WHERE node IN ({nodes})
+"""
+
+GET_GRAPH_DEPENDENTS = """
+    SELECT
+        name,
+        redges
+    FROM depgraph
+    WHERE name IN ({names})
+"""
+
+GET_GRAPH_UNRESOLVED = """
+    SELECT
+        name,
+        unresolved
+    FROM depgraph
+    WHERE unresolved != '[]'
+"""
+
+GET_CROSSING_DEPENDENTS = """
+    SELECT
+        name,
+        dependent,
+        repo
+    FROM crossing
+    WHERE name IN ({names})
+"""
+
+GET_SOURCE_PACKAGE_NAMES = """
+    SELECT DISTINCT
+        name
+    FROM packages
+    WHERE rpm_sourcename = ?
+"""
+
+GET_PROVIDERS = """
+    SELECT v.name, p.name FROM provides v JOIN packages p ON p.pkgKey = v.pkgKey
+    WHERE v.name IN ({names})
+    UNION
+    SELECT f.name, p.name FROM files f JOIN packages p ON p.pkgKey = f.pkgKey
+    WHERE f.name IN ({names})
+"""
@@ -21,91 +21,281 @@ License and may only be used or replicated with the express permission
 of Red Hat, Inc.
 """
 
-import os
+import asyncio
+import json
 import re
+import sys
+from array import array
 
-import aiosqlite
 from aiohttp.web import HTTPBadRequest, HTTPNotFound
 
 from mdapi.confdata import standard
+from mdapi.database.base import REPOTYPES, select_providers
+from mdapi.database.rpmvers import evr_key
 from mdapi.database.sqlq import (
     GET_CHANGELOGS,
-    GET_CO_PACKAGE,
+    GET_CHANGELOGS_PAGE,
+    GET_CROSSING_DEPENDENTS,
+    GET_FILE_OWNERS,
+    GET_FILE_OWNERS_UNDER,
     GET_FILES,
+    GET_FILES_PAGE,
+    GET_GRAPH_DEPENDENTS,
+    GET_GRAPH_NAMES,
+    GET_GRAPH_NODES,
+    GET_GRAPH_UNRESOLVED,
     GET_PACKAGE,
     GET_PACKAGE_BY,
+    GET_PACKAGE_BY_SOURCE_NAME,
     GET_PACKAGE_BY_SRC,
-    GET_PACKAGE_INFO,
+    GET_PACKAGE_NAMES,
+    GET_PACKAGE_RELATIONS,
+    GET_PACKAGES,
+    GET_PACKAGES_BY_ID,
+    GET_PROVIDERS,
+    GET_SOURCE_PACKAGE_NAMES,
+    GET_UNIFIED_PACKAGE,
+    GET_UNIFIED_PACKAGE_BY_SOURCE_NAME,
+    GET_UNIFIED_PACKAGES,
+    NAMED_AFTER_SOURCE,
+    ORDER_BY_EVR_KEY,
+    ORDER_BY_EVR_TEXT,
+    ORDER_BY_NEWEST,
+    ORDER_BY_RANK,
+    RELATIONS,
+    SEARCH_PACKAGES,
+    SUGGEST_NAMES,
+    SUGGEST_NAMES_FROM,
+    SUGGEST_NAMES_PREFIX,
 )
 from mdapi.services.apimodel import ChangeLog, Dependencies, FileList, Packages
+from mdapi.services.catalog import catalog
+from mdapi.services.connpool import LANE_DEFAULT, LANE_SEARCH, pool
 
+# Packages expanded per query, the pkgKeys get bound once for each of the relations
+EXPAND_CHUNK = 100
 
-async def _get_package(brch, name=None, actn=None, srcn=None):
+# Names looked up per query by the bulk lookup, well below the limit of SQLite on bound parameters
+LOOKUP_CHUNK = 500
+
+# Rows fetched at once when streaming the files and the changelogs of a package
+STREAM_CHUNK = 256
+
+# Largest integer SQLite can store, the changelog cursor of the first page points past it
+SQLITE_MAXINT = 2**63 - 1
+
+# The packages requiring others across the repositories of the branches without a unified
+# database, keyed by branch along with the identities of the databases they were resolved from
+crossings = {}
+
+
+async def _package_order(dtbs, alias=""):
+    """
+    Return the ordering of the packages of the given primary database from the latest to the
+    oldest, by their sortable key if the database has one
+    """
+    schema = await pool.schema(dtbs.dtbsfile, dtbs.inode)
+    order = ORDER_BY_EVR_KEY if "evr_key" in schema.get("packages", ()) else ORDER_BY_EVR_TEXT
+    return order.format(alias)
+
+
+def _unified_repotype(repo):
+    return None if repo == "release" else repo
+
+
+async def _get_unified_package(dtbs, name=None, srcn=None, repo=None, newest=False):
+    """
+    Return the package information for the given package and its repository type from the
+    database consolidating all the repositories of a branch, or None if it is not there
+    """
+    order = ORDER_BY_NEWEST if newest else ORDER_BY_RANK
+    order = order.format(NAMED_AFTER_SOURCE if srcn else "")
+    sqlquery, sqlparams = (GET_UNIFIED_PACKAGE.format(order=order), (name, repo))
+    if srcn:
+        sqlquery, sqlparams = (GET_UNIFIED_PACKAGE_BY_SOURCE_NAME.format(order=order), (srcn, repo))
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+        async with dtbsobjc.execute(sqlquery, sqlparams) as dbcursor:
+            pkgc = await dbcursor.fetchone()
+    if not pkgc:
+        return None
+    return (Packages(*pkgc[1:]), _unified_repotype(pkgc[0]))
+
+
+async def _find_package(dtbs, name=None, actn=None, srcn=None):
+    """
+    Return the package information for the given package in the given primary database, or None
+    if it is not there
+    """
+    columns = (await pool.schema(dtbs.dtbsfile, dtbs.inode)).get("packages", ())
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+        if actn:
+            """
+            It is safe to format the query since the action does not come from the user.
+            """
+            sqlquery = GET_PACKAGE_BY.format(actn, order=await _package_order(dtbs, "p."))
+            async with dtbsobjc.execute(sqlquery, (name,)) as dbcursor:
+                pkgc = await dbcursor.fetchall()
+            if pkgc:
+                return [Packages(*item) for item in pkgc]
+        elif srcn and "rpm_sourcename" in columns:
+            async with dtbsobjc.execute(GET_PACKAGE_BY_SOURCE_NAME, (srcn,)) as dbcursor:
+                pkgc = await dbcursor.fetchone()
+            if pkgc:
+                return Packages(*pkgc)
+        elif srcn:
+            # The databases indexed before the source names were introduced
+            sqlquery = GET_PACKAGE_BY_SRC.format(order=await _package_order(dtbs))
+            async with dtbsobjc.execute(sqlquery, (f"{srcn}-%",)) as dbcursor:
+                pkgc = await dbcursor.fetchall()
+            # Try to match the package with the source name at first
+            for pkgx in pkgc:
+                if pkgx[2] == srcn:
+                    return Packages(*pkgx)
+
+            ptrn = re.compile(f"{re.escape(srcn)}-[0-9]")
+            for pkgx in pkgc:
+                if ptrn.match(pkgx[3]):
+                    return Packages(*pkgx)
+        else:
+            sqlquery = GET_PACKAGE.format(order=await _package_order(dtbs))
+            async with dtbsobjc.execute(sqlquery, (name,)) as dbcursor:
+                pkgc = await dbcursor.fetchone()
+            if pkgc:
+                return Packages(*pkgc)
+    return None
+
+
+async def _get_package(brch, name=None, actn=None, srcn=None, repo=None, newest=False):
     """
     Return the package information for the given package in the specified branch or raise an
-    aiohttp exception
+    aiohttp exception - from the given repository only if one is given, and the latest of all the
+    repositories having it if asked for rather than from the first of them
     """
     if (not name and not srcn) or (name and srcn):
         raise HTTPBadRequest()
 
-    pckg = None
-    wrongdbs = False
+    repolist = catalog.branch(brch)
+    if not repolist:
+        raise HTTPBadRequest()
+
+    # A single query finds the package in the branch when its repositories were consolidated
+    unified = repolist.get(None, {}).get("unified")
+    if unified and not actn:
+        rslt = await _get_unified_package(unified, name, srcn, repo, newest)
+        if rslt:
+            return rslt
+        if not repolist.get(None, {}).get("primary"):
+            raise HTTPBadRequest()
+        raise HTTPNotFound()
 
-    for repotype in ["updates-testing", "updates", "testing", None]:
-        if repotype:
-            dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-{repotype}-primary.sqlite"
-        else:
-            dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-primary.sqlite"
+    found = []
+    for repotype in [_unified_repotype(repo)] if repo else REPOTYPES:
+        dtbs = repolist.get(repotype, {}).get("primary")
+        if not dtbs:
+            continue
+
+        pckg = await _find_package(dtbs, name, actn, srcn)
+        if pckg:
+            found.append((pckg, repotype))
+            if not newest:
+                break
 
-        if not os.path.exists(dtbsfile):
-            wrongdbs = True
+    if not found:
+        if not repolist.get(None, {}).get("primary"):
+            raise HTTPBadRequest()
+        raise HTTPNotFound()
+
+    if newest:
+        # The first of the repositories wins a tie, as the unified database orders them by rank
+        return max(
+            found,
+            key=lambda item: (
+                item[0].name == srcn,
+                evr_key(item[0].epoch, item[0].version, item[0].release),
+            ),
+        )
+    return found[0]
+
+
+async def _get_packages(brch, names):
+    """
+    Return the package information for every one of the given package names in the specified
+    branch, with None for the names that are not found in any of its repositories
+    """
+    repolist = catalog.branch(brch)
+    if not repolist:
+        raise HTTPBadRequest()
+
+    foundset = {}
+    pending = list(names)
+
+    unified = repolist.get(None, {}).get("unified")
+    if unified:
+        # The packages are found in a single database, their relations are in their repository
+        found = {}
+        async with pool.connect(unified.dtbsfile, unified.inode) as dtbsobjc:
+            for indx in range(0, len(pending), LOOKUP_CHUNK):
+                namechunk = pending[indx : indx + LOOKUP_CHUNK]
+                sqlquery = GET_UNIFIED_PACKAGES.format(names=", ".join("?" * len(namechunk)))
+                async with dtbsobjc.execute(sqlquery, namechunk) as dbcursor:
+                    for item in await dbcursor.fetchall():
+                        found.setdefault(item[3], (_unified_repotype(item[0]), Packages(*item[1:])))
+        for repotype in REPOTYPES:
+            pkgs = {name: pckg for name, (repo, pckg) in found.items() if repo == repotype}
+            if pkgs:
+                infolist = await _expand_package_info(list(pkgs.values()), brch, repotype)
+                for info, name in zip(infolist, pkgs):
+                    foundset[name] = info
+        pending = []
+
+    for repotype in REPOTYPES:
+        dtbs = repolist.get(repotype, {}).get("primary")
+        if not dtbs or not pending:
             continue
 
-        wrongdbs = False
-        async with aiosqlite.connect(dtbsfile) as dtbsobjc:
-            if actn:
+        pkgs = {}
+        order = await _package_order(dtbs)
+        async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+            for indx in range(0, len(pending), LOOKUP_CHUNK):
+                namechunk = pending[indx : indx + LOOKUP_CHUNK]
                 """
-                It is safe to format the query since the action does not come from the user.
+                It is safe to format the query since only placeholders are inserted.
                 """
-                sqlquery = GET_PACKAGE_BY.format(actn)
-                async with dtbsobjc.execute(sqlquery, (name,)) as dbcursor:
-                    pkgc = await dbcursor.fetchall()
-                if pkgc:
-                    pckg = [Packages(*item) for item in pkgc]
-                    break
-            elif srcn:
-                async with dtbsobjc.execute(GET_PACKAGE_BY_SRC, (f"{srcn}-%",)) as dbcursor:
-                    pkgc = await dbcursor.fetchall()
-                if pkgc:
-                    for pkgx in pkgc:
-                        # Try to match the package with the source name at first
-                        if pkgx[2] == srcn:
-                            pckg = Packages(*pkgx)
-                            break
-
-                    if pckg:
-                        break
+                sqlquery = GET_PACKAGES.format(names=", ".join("?" * len(namechunk)), order=order)
+                async with dtbsobjc.execute(sqlquery, namechunk) as dbcursor:
+                    for item in await dbcursor.fetchall():
+                        # Only keep the first row of every name, as ordered by the query
+                        pkgs.setdefault(item[2], Packages(*item))
 
-                    srcn = re.escape(srcn)
-                    ptrn = re.compile(f"{srcn}-[0-9]")
-                    for pkgx in pkgc:
-                        if ptrn.match(pkgx[3]):
-                            pckg = Packages(*pkgx)
-                            break
-            else:
-                async with dtbsobjc.execute(GET_PACKAGE, (name,)) as dbcursor:
-                    pkgc = await dbcursor.fetchone()
-                if pkgc:
-                    pckg = Packages(*pkgc)
-                    break
+        if pkgs:
+            infolist = await _expand_package_info(list(pkgs.values()), brch, repotype)
+            # Both follow the order of the packages in the dictionary
+            for info, name in zip(infolist, pkgs):
+                foundset[name] = info
+            pending = [name for name in pending if name not in pkgs]
 
-    if wrongdbs:
-        raise HTTPBadRequest()
+    return {name: foundset.get(name) for name in names}
 
-    if not pckg:
-        raise HTTPNotFound()
 
-    return (pckg, repotype)
+async def _get_package_everywhere(name):
+    """
+    Return the package information for the given package in every branch, looking them up
+    concurrently but never more than FANOUT_LIMIT of them at once, with None for the branches
+    that do not have it
+    """
+    semaphore = asyncio.Semaphore(standard.FANOUT_LIMIT)
+
+    async def lookup(brch):
+        async with semaphore:
+            try:
+                pckg, repotype = await _get_package(brch, name)
+            except (HTTPBadRequest, HTTPNotFound):
+                return None
+            return await _expand_package_info(pckg, brch, repotype)
+
+    brchlist = catalog.list_branches()
+    rsltlist = await asyncio.gather(*(lookup(brch) for brch in brchlist))
+    return dict(zip(brchlist, rsltlist))
 
 
 async def _expand_package_info(pkgs, brch, repotype):
@@ -120,51 +310,38 @@ async def _expand_package_info(pkgs, brch, repotype):
         pkgs = [pkgs]
 
     rslt = []
+    dtbs = catalog.locate(brch, repotype, "primary")
 
-    for pkgx in pkgs:
-        otpt = pkgx.to_json()
-        if repotype:
-            dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-{repotype}-primary.sqlite"
-        else:
-            dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-primary.sqlite"
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+        for indx in range(0, len(pkgs), EXPAND_CHUNK):
+            pkgchunk = pkgs[indx : indx + EXPAND_CHUNK]
+            keys = [pkgx.pkgKey for pkgx in pkgchunk]
+            srcs = list({pkgx.rpm_sourcerpm for pkgx in pkgchunk if pkgx.rpm_sourcerpm})
 
-        async with aiosqlite.connect(dtbsfile) as dtbsobjc:
             """
             Fill in some extra info
-            Basic information is always present regardless of the version of the repository
+            Basic information is always present regardless of the version of the repository, the
+            list of packages built from the same src.rpm comes along in the same query.
+            It is safe to format the query since only placeholders are inserted.
             """
-            for datatype in [
-                "conflicts",
-                "obsoletes",
-                "provides",
-                "requires",
-                "enhances",
-                "recommends",
-                "suggests",
-                "supplements",
-            ]:
-                """
-                It is safe to format the query since the datatype does not come from the user.
-                """
-                sqlquery = GET_PACKAGE_INFO.format(datatype)
-                async with dtbsobjc.execute(sqlquery, (pkgx.pkgKey,)) as dbcursor:
-                    data = await dbcursor.fetchall()
-                    if data:
-                        otpt[datatype] = [Dependencies(*item).to_json() for item in data]
+            sqlquery = GET_PACKAGE_RELATIONS.format(
+                keys=", ".join("?" * len(keys)), srcs=", ".join("?" * len(srcs))
+            )
+            relalist = {pkgKey: {relation: [] for relation in RELATIONS} for pkgKey in keys}
+            cosrcpkg = {source: [] for source in srcs}
+            async with dtbsobjc.execute(sqlquery, keys * len(RELATIONS) + srcs) as dbcursor:
+                for relation, source, *item in await dbcursor.fetchall():
+                    if relation == "co-packages":
+                        cosrcpkg[source].append(item[2])
                     else:
-                        otpt[datatype] = data
+                        relalist[item[1]][relation].append(Dependencies(*item).to_json())
 
-            """
-            Add the list of packages built from the same src.rpm
-            """
-            if pkgx.rpm_sourcerpm:
-                async with dtbsobjc.execute(GET_CO_PACKAGE, (pkgx.rpm_sourcerpm,)) as dbcursor:
-                    cosrcpkg = await dbcursor.fetchall()
-                otpt["co-packages"] = [cpkg[0] for cpkg in cosrcpkg]
-            else:
-                otpt["co-packages"] = []
-            otpt["repo"] = repotype if repotype else "release"
-            rslt.append(otpt)
+            for pkgx in pkgchunk:
+                otpt = pkgx.to_json()
+                otpt.update(relalist[pkgx.pkgKey])
+                otpt["co-packages"] = list(cosrcpkg.get(pkgx.rpm_sourcerpm, []))
+                otpt["repo"] = repotype if repotype else "release"
+                rslt.append(otpt)
 
     if singletonset:
         return rslt[0]
@@ -172,53 +349,557 @@ async def _expand_package_info(pkgs, brch, repotype):
         return rslt
 
 
+async def _stream_rows(dtbs, sqlquery, sqlparams, datatype, modlobjc, repotype):
+    """
+    Yield the JSON document listing the rows returned by the query under the given key, one batch
+    of rows at a time, so that it never has to be held in memory as a whole
+    """
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+        async with dtbsobjc.execute(sqlquery, sqlparams) as dbcursor:
+            yield f"{{{json.dumps(datatype)}: [".encode()
+            separator = ""
+            while True:
+                rowslist = await dbcursor.fetchmany(STREAM_CHUNK)
+                if not rowslist:
+                    break
+                yield (
+                    separator
+                    + ", ".join(json.dumps(modlobjc(*item).to_json()) for item in rowslist)
+                ).encode()
+                separator = ", "
+    yield ('], "repo": ' + json.dumps(repotype if repotype else "release") + "}").encode()
+
+
 async def _get_files(pkid, brch, repotype):
     """
-    Return the list of files for the given package in the specified branch.
+    Return the list of files for the given package in the specified branch as an asynchronous
+    iterator over the chunks of the JSON document.
     """
-    if repotype:
-        dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-{repotype}-filelists.sqlite"
-    else:
-        dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-filelists.sqlite"
+    dtbs = catalog.locate(brch, repotype, "filelists")
+    if not dtbs:
+        raise HTTPBadRequest()
+
+    return _stream_rows(dtbs, GET_FILES, (pkid,), "files", FileList, repotype)
 
-    if not os.path.exists(dtbsfile):
+
+async def _get_changelog(pkid, brch, repotype):
+    """
+    Return the changelog for the given packages in the specified branch as an asynchronous
+    iterator over the chunks of the JSON document.
+    """
+    dtbs = catalog.locate(brch, repotype, "other")
+    if not dtbs:
         raise HTTPBadRequest()
 
-    async with aiosqlite.connect(dtbsfile) as dtbsobjc:
-        async with dtbsobjc.execute(GET_FILES, (pkid,)) as dbcursor:
-            filelist = await dbcursor.fetchall()
+    return _stream_rows(dtbs, GET_CHANGELOGS, (pkid,), "changelogs", ChangeLog, repotype)
 
-    filelist = [FileList(*item) for item in filelist]
+
+async def _get_files_page(pkid, brch, repotype, limit, cursor=None):
+    """
+    Return a page of at most `limit` files for the given package in the specified branch,
+    starting after the provided cursor, along with the cursor of the next page if there is one.
+    """
+    dtbs = catalog.locate(brch, repotype, "filelists")
+    if not dtbs:
+        raise HTTPBadRequest()
+
+    try:
+        rowid = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPBadRequest() from None
+
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+        async with dtbsobjc.execute(GET_FILES_PAGE, (pkid, rowid, limit + 1)) as dbcursor:
+            filelist = await dbcursor.fetchall()
 
     rslt = {
-        "files": [fileinfo.to_json() for fileinfo in filelist],
+        "files": [FileList(*item[1:]).to_json() for item in filelist[:limit]],
         "repo": repotype if repotype else "release",
+        "next": str(filelist[limit - 1][0]) if len(filelist) > limit else None,
     }
 
     return rslt
 
 
-async def _get_changelog(pkid, brch, repotype):
+async def _get_changelog_page(pkid, brch, repotype, limit, since=0, cursor=None):
     """
-    Return the changelog for the given packages in the specified branch.
+    Return a page of at most `limit` changelog entries, dated `since` or later, for the given
+    package in the specified branch, starting after the provided cursor, along with the cursor of
+    the next page if there is one.
     """
-    if repotype:
-        dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-{repotype}-other.sqlite"
-    else:
-        dtbsfile = f"{standard.DB_FOLDER}/mdapi-{brch}-other.sqlite"
-
-    if not os.path.exists(dtbsfile):
+    dtbs = catalog.locate(brch, repotype, "other")
+    if not dtbs:
         raise HTTPBadRequest()
 
-    async with aiosqlite.connect(dtbsfile) as dtbsfile:
-        async with dtbsfile.execute(GET_CHANGELOGS, (pkid,)) as dbcursor:
-            changeloglist = await dbcursor.fetchall()
+    try:
+        date, rowid = (int(item) for item in cursor.split(".")) if cursor else (SQLITE_MAXINT,) * 2
+    except ValueError:
+        raise HTTPBadRequest() from None
 
-    changeloglist = [ChangeLog(*item) for item in changeloglist]
+    sqlparams = (pkid, since, date, rowid, limit + 1)
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode) as dtbsobjc:
+        async with dtbsobjc.execute(GET_CHANGELOGS_PAGE, sqlparams) as dbcursor:
+            changeloglist = await dbcursor.fetchall()
 
+    lastitem = changeloglist[limit - 1] if len(changeloglist) > limit else None
     rslt = {
-        "changelogs": [changelog.to_json() for changelog in changeloglist],
+        "changelogs": [ChangeLog(*item[1:]).to_json() for item in changeloglist[:limit]],
         "repo": repotype if repotype else "release",
+        "next": f"{lastitem[4]}.{lastitem[0]}" if lastitem else None,
     }
 
     return rslt
+
+
+async def _select_in(dtbs, sqlquery, field, values, lane=LANE_DEFAULT):
+    """
+    Return the rows of the query run over the given values, bound in place of every occurrence of
+    the field of the query and so few at a time that no more than LOOKUP_CHUNK parameters get bound
+    """
+    rowslist = []
+    values = list(values)
+    repeat = sqlquery.count(f"{{{field}}}")
+    size = max(LOOKUP_CHUNK // repeat, 1)
+    async with pool.connect(dtbs.dtbsfile, dtbs.inode, lane) as dtbsobjc:
+        for indx in range(0, len(values), size):
+            chunk = values[indx : indx + size]
+            """
+            It is safe to format the query since only placeholders are inserted.
+            """
+            sqltext = sqlquery.format(**{field: ", ".join("?" * len(chunk))})
+            async with dtbsobjc.execute(sqltext, chunk * repeat) as dbcursor:
+                rowslist.extend(await dbcursor.fetchall())
+    return rowslist
+
+
+async def _get_file_owners(brch, path, under=False, limit=1):
+    """
+    Return at most `limit` of the files of the given path, or under the given directory, along
+    with the packages shipping them in the specified branch.  The packages of a repository hide
+    those of the same name in the repositories looked up after it, as _get_package does.
+    """
+    repolist = catalog.branch(brch)
+    if not repolist:
+        raise HTTPBadRequest()
+
+    rslt, truncated, newer = [], False, []
+
+    for repotype in REPOTYPES:
+        prmy = repolist.get(repotype, {}).get("primary")
+        flst = repolist.get(repotype, {}).get("filelists")
+        if not prmy:
+            continue
+        # The databases indexed before the paths were introduced cannot be searched
+        if flst and "filepath" in await pool.schema(flst.dtbsfile, flst.inode):
+            async with pool.connect(flst.dtbsfile, flst.inode) as dtbsobjc:
+                if under:
+                    sqlparams = (f"{path}/", f"{path}0", limit + 1)
+                    dbcursor = await dtbsobjc.execute(GET_FILE_OWNERS_UNDER, sqlparams)
+                else:
+                    dbcursor = await dtbsobjc.execute(GET_FILE_OWNERS, (path, limit + 1))
+                async with dbcursor:
+                    filelist = await dbcursor.fetchall()
+            truncated = truncated or len(filelist) > limit
+            filelist = filelist[:limit]
+
+            pkgs = {
+                item[0]: item[1:]
+                for item in await _select_in(
+                    prmy, GET_PACKAGES_BY_ID, "ids", {pkgId for _, pkgId in filelist}
+                )
+            }
+            hidden = await _hidden_names(newer, {item[0] for item in pkgs.values()})
+
+            for filepath, pkgId in filelist:
+                if pkgId not in pkgs or pkgs[pkgId][0] in hidden:
+                    continue
+                name, epoch, version, release, arch = pkgs[pkgId]
+                rslt.append(
+                    {
+                        "path": filepath,
+                        "name": name,
+                        "epoch": epoch,
+                        "version": version,
+                        "release": release,
+                        "arch": arch,
+                        "repo": repotype if repotype else "release",
+                    }
+                )
+        newer.append(prmy)
+
+    rslt.sort(key=lambda item: (item["path"], item["name"]))
+    return {"files": rslt[:limit], "truncated": truncated or len(rslt) > limit}
+
+
+async def _hidden_names(newer, names):
+    """
+    Return those of the given package names found in any of the given primary databases, those of
+    the newer repositories hiding the packages of the same name in the older ones
+    """
+    hidden = set()
+    for dtbs in newer:
+        rowslist = await _select_in(dtbs, GET_PACKAGE_NAMES, "names", set(names) - hidden)
+        hidden.update(item[0] for item in rowslist)
+    return hidden
+
+
+async def _search_packages(brch, text, limit, offset=0):
+    """
+    Return at most `limit` of the packages whose name, summary or description match all the words
+    of the given text in the specified branch, the best matches first, skipping the first `offset`
+    of them, along with the offset of the next page if there is one within SEARCH["depth"]
+    """
+    repolist = catalog.branch(brch)
+    if not repolist:
+        raise HTTPBadRequest()
+
+    # Every word is quoted so that nothing in the text is taken for the query syntax of FTS5
+    wordlist = text.split()
+    if not wordlist:
+        raise HTTPBadRequest()
+    sqlmatch = " ".join('"{}"'.format(word.replace('"', '""')) for word in wordlist)
+
+    wanted = offset + limit + 1
+    rslt, newer = [], []
+    for repotype in REPOTYPES:
+        dtbs = repolist.get(repotype, {}).get("primary")
+        if not dtbs:
+            continue
+        # The databases indexed before the full-text search was introduced cannot be searched
+        if "packages_fts" in await pool.schema(dtbs.dtbsfile, dtbs.inode):
+            kept, consumed, listed = [], 0, set()
+            async with pool.connect(dtbs.dtbsfile, dtbs.inode, LANE_SEARCH) as dtbsobjc:
+                while len(kept) < wanted:
+                    sqlparams = (sqlmatch, wanted, consumed)
+                    async with dtbsobjc.execute(SEARCH_PACKAGES, sqlparams) as dbcursor:
+                        rowslist = await dbcursor.fetchall()
+                    consumed += len(rowslist)
+                    # Every name is listed once, in the place of its best match
+                    hidden = await _hidden_names(newer, {item[0] for item in rowslist})
+                    for item in rowslist:
+                        if item[0] not in hidden and item[0] not in listed:
+                            kept.append(item)
+                            listed.add(item[0])
+                    if len(rowslist) < wanted:
+                        break
+            rslt.extend((item, repotype) for item in kept[:wanted])
+        newer.append(dtbs)
+
+    rslt.sort(key=lambda pair: pair[0][-1])
+    pagelist = [
+        {
+            "name": name,
+            "summary": summary,
+            "epoch": epoch,
+            "version": version,
+            "release": release,
+            "arch": arch,
+            "repo": repotype if repotype else "release",
+        }
+        for (name, summary, epoch, version, release, arch, _), repotype in rslt[offset:][:limit]
+    ]
+    return {
+        "results": pagelist,
+        "next": (
+            str(offset + limit)
+            if len(rslt) > offset + limit and offset + limit <= standard.SEARCH["depth"]
+            else None
+        ),
+    }
+
+
+def _trigrams(text):
+    """
+    Return the sequences of three characters of the given text, padded so that its first and
+    last characters weigh as much as the others
+    """
+    text = f"  {text.lower()} "
+    return {text[indx : indx + 3] for indx in range(len(text) - 2)}
+
+
+def _prefix_bound(fragment):
+    """
+    Return the smallest text sorting after every text starting with the given fragment, or None
+    if there is none since the fragment is only made of the last character of Unicode
+    """
+    stem = fragment.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return None
+    point = ord(stem[-1]) + 1
+    # The surrogates cannot be encoded in UTF-8 and the next character sorts right after them
+    if 0xD800 <= point <= 0xDFFF:
+        point = 0xE000
+    return stem[:-1] + chr(point)
+
+
+async def _suggest_names(brch, fragment, limit):
+    """
+    Return the `limit` package names of the specified branch the closest to the given fragment,
+    ranked by the share of their sequences of three characters they have in common with it
+    """
+    repolist = catalog.branch(brch)
+    if not repolist:
+        raise HTTPBadRequest()
+
+    # Every sequence is quoted so that nothing in the fragment is taken for the query syntax of FTS5
+    lowered = fragment.lower()
+    wordlist = {lowered[indx : indx + 3] for indx in range(len(lowered) - 2)}
+    sqlmatch = " OR ".join('"{}"'.format(word.replace('"', '""')) for word in sorted(wordlist))
+    # SQLite only folds the case of the ASCII letters, which is all bytes.lower() folds too
+    folded = fragment.encode().lower().decode()
+    upper = _prefix_bound(folded)
+
+    names = set()
+    for repotype in REPOTYPES:
+        dtbs = repolist.get(repotype, {}).get("primary")
+        if not dtbs:
+            continue
+        async with pool.connect(dtbs.dtbsfile, dtbs.inode, LANE_SEARCH) as dtbsobjc:
+            if wordlist and "packages_trigram" in await pool.schema(dtbs.dtbsfile, dtbs.inode):
+                sqlparams = (sqlmatch, standard.SUGGEST["candidates"])
+                dbcursor = await dtbsobjc.execute(SUGGEST_NAMES, sqlparams)
+            else:
+                # Too short a fragment or a database indexed before the trigrams were introduced
+                if upper is None:
+                    sqlparams = (folded, standard.SUGGEST["candidates"])
+                    dbcursor = await dtbsobjc.execute(SUGGEST_NAMES_FROM, sqlparams)
+                else:
+                    sqlparams = (folded, upper, standard.SUGGEST["candidates"])
+                    dbcursor = await dtbsobjc.execute(SUGGEST_NAMES_PREFIX, sqlparams)
+            async with dbcursor:
+                names.update(item[0] for item in await dbcursor.fetchall())
+
+    frgmgram = _trigrams(lowered)
+    rslt = []
+    for name in names:
+        namegram = _trigrams(name)
+        score = len(frgmgram & namegram) / len(frgmgram | namegram)
+        rslt.append((-score, not name.lower().startswith(lowered), len(name), name))
+    rslt.sort()
+
+    return [{"name": name, "score": round(-score, 3)} for score, _, _, name in rslt[:limit]]
+
+
+async def _graph_nodes(graphs, names):
+    """
+    Return the repository, the names of the packages providing the requirements and the
+    requirements left unresolved in that repository of every one of the given packages, each taken
+    from the first of the dependency graphs having it
+    """
+    rslt, pending = {}, set(names)
+    for repotype, dtbs in graphs:
+        if not pending:
+            break
+        rowslist = await _select_in(dtbs, GET_GRAPH_NODES, "names", pending, LANE_SEARCH)
+        edgelist = {}
+        for _, name, edges, _ in rowslist:
+            edgelist[name] = array("I")
+            edgelist[name].frombytes(edges)
+        nodelist = set().union(*edgelist.values())
+        nodename = dict(await _select_in(dtbs, GET_GRAPH_NAMES, "nodes", nodelist, LANE_SEARCH))
+        for _, name, _, unresolved in rowslist:
+            rslt[name] = (
+                repotype,
+                {nodename[node] for node in edgelist[name]},
+                json.loads(unresolved),
+            )
+        pending.difference_update(edgelist)
+    return rslt
+
+
+async def _graph_providers(graphs, capabilities):
+    """
+    Return the names of the packages providing every one of the given capabilities, as packages
+    or as files, in any of the repositories
+    """
+    rslt = {}
+    for _, dtbs in graphs:
+        if not capabilities:
+            break
+        rowslist = await _select_in(dtbs, GET_PROVIDERS, "names", capabilities, LANE_SEARCH)
+        for capability, name in rowslist:
+            rslt.setdefault(capability, set()).add(name)
+    return rslt
+
+
+async def _dependency_graphs(brch, column="edges"):
+    """
+    Return the repository types and the primary databases of the specified branch that have a
+    dependency graph with the given column, in the order in which they are looked up for a package
+    """
+    repolist = catalog.branch(brch)
+    if not repolist:
+        raise HTTPBadRequest()
+
+    graphs = []
+    for repotype in REPOTYPES:
+        dtbs = repolist.get(repotype, {}).get("primary")
+        # The databases indexed before the dependency graphs were introduced are left out
+        if dtbs and column in (await pool.schema(dtbs.dtbsfile, dtbs.inode)).get("depgraph", ()):
+            graphs.append((repotype, dtbs))
+    if not graphs:
+        raise HTTPBadRequest()
+    return graphs
+
+
+async def _get_closure(brch, name):
+    """
+    Return the packages the given package requires at runtime in the specified branch, directly
+    or not, along with the number of hops it takes to get to them, and the requirements that no
+    package provides
+    """
+    graphs = await _dependency_graphs(brch)
+
+    depth, repos, missing = {name: 0}, {}, set()
+    frontier, level = {name}, 0
+    while frontier:
+        nodes = await _graph_nodes(graphs, frontier)
+        if not level and name not in nodes:
+            raise HTTPNotFound()
+        capabilities = set().union(*(unresolved for _, _, unresolved in nodes.values()))
+        providers = await _graph_providers(graphs, capabilities)
+
+        level, upcoming = level + 1, set()
+        for pkgname, (repotype, required, unresolved) in nodes.items():
+            repos[pkgname] = repotype
+            upcoming.update(required)
+            for capability in unresolved:
+                if capability in providers:
+                    upcoming.update(select_providers(providers[capability], capability))
+                else:
+                    missing.add(capability)
+        frontier = upcoming.difference(depth)
+        depth.update(dict.fromkeys(frontier, level))
+
+    return {
+        "name": name,
+        "requires": [
+            {"name": pkgname, "depth": depth[pkgname], "repo": repos.get(pkgname) or "release"}
+            for pkgname in sorted(depth, key=lambda item: (depth[item], item))
+            if pkgname != name
+        ],
+        "unresolved": sorted(missing),
+    }
+
+
+async def _graph_repos(graphs, names):
+    """
+    Return the repository of every one of the given package names, the first of the dependency
+    graphs having a package of that name
+    """
+    rslt = {}
+    for repotype, dtbs in graphs:
+        pending = set(names).difference(rslt)
+        if not pending:
+            break
+        for item in await _select_in(dtbs, GET_PACKAGE_NAMES, "names", pending, LANE_SEARCH):
+            rslt[item[0]] = repotype
+    return rslt
+
+
+async def _resolve_crossing(graphs):
+    """
+    Return the names and the repositories of the packages requiring every package through the
+    requirements left unresolved in their own repository, which the closure resolves in the others
+    """
+    rslt = {}
+    if len(graphs) < 2:
+        return rslt
+    for repotype, dtbs in graphs:
+        async with pool.connect(dtbs.dtbsfile, dtbs.inode, LANE_SEARCH) as dtbsobjc:
+            async with dtbsobjc.execute(GET_GRAPH_UNRESOLVED) as dbcursor:
+                rowslist = await dbcursor.fetchall()
+        unresolved = {name: json.loads(capabilities) for name, capabilities in rowslist}
+        providers = await _graph_providers(graphs, set().union(*unresolved.values()))
+        for name, capabilities in unresolved.items():
+            for capability in capabilities:
+                for pkgname in select_providers(providers.get(capability, set()), capability):
+                    rslt.setdefault(pkgname, set()).add((name, repotype))
+    return rslt
+
+
+async def _crossing_dependents(brch, graphs, names):
+    """
+    Return the names and the repositories of the packages requiring every one of the given packages
+    across the repositories, as compiled into the unified database of the branch at ingestion or
+    else as resolved once for the current databases of the branch
+    """
+    unified = catalog.locate(brch, None, "unified")
+    if unified and "crossing" in await pool.schema(unified.dtbsfile, unified.inode):
+        rslt = {}
+        for name, dependent, repo in await _select_in(
+            unified, GET_CROSSING_DEPENDENTS, "names", names, LANE_SEARCH
+        ):
+            rslt.setdefault(name, set()).add((dependent, _unified_repotype(repo)))
+        return rslt
+
+    stamp = tuple(dtbs.stamp for _, dtbs in graphs)
+    if crossings.get(brch, (None, None))[0] != stamp:
+        crossings[brch] = (stamp, await _resolve_crossing(graphs))
+    crossing = crossings[brch][1]
+    return {name: crossing[name] for name in names if name in crossing}
+
+
+async def _stream_impact(brch, graphs, srcname, roots, maxdepth):
+    """
+    Yield the JSON document listing the packages requiring the given ones in the dependency graphs,
+    directly or not, one level of the reverse traversal at a time
+    """
+    yield f'{{"source": {json.dumps(srcname)}, "packages": ['.encode()
+    seen, frontier, separator = set(roots), roots, ""
+    for level in range(maxdepth + 1):
+        if level:
+            candidates = {}
+            for repotype, dtbs in graphs:
+                nodes = array("I")
+                for _, redges in await _select_in(
+                    dtbs, GET_GRAPH_DEPENDENTS, "names", set(frontier), LANE_SEARCH
+                ):
+                    nodes.frombytes(redges)
+                for _, name in await _select_in(
+                    dtbs, GET_GRAPH_NAMES, "nodes", set(nodes), LANE_SEARCH
+                ):
+                    candidates.setdefault(name, set()).add(repotype)
+            for dependents in (await _crossing_dependents(brch, graphs, frontier)).values():
+                for name, repotype in dependents:
+                    candidates.setdefault(name, set()).add(repotype)
+
+            # The packages hidden by those of the same name in a newer repository are not installed
+            repos = await _graph_repos(graphs, set(candidates).difference(seen))
+            frontier = {
+                name: repotype for name, repotype in repos.items() if repotype in candidates[name]
+            }
+            seen.update(frontier)
+        if not frontier:
+            break
+        yield (
+            separator
+            + ", ".join(
+                json.dumps({"name": name, "depth": level, "repo": frontier[name] or "release"})
+                for name in sorted(frontier)
+            )
+        ).encode()
+        separator = ", "
+    yield f'], "truncated": {json.dumps(bool(frontier) and level == maxdepth)}}}'.encode()
+
+
+async def _get_impact(brch, srcname, maxdepth):
+    """
+    Return the packages built from the given source package in the specified branch and those
+    requiring them at runtime, directly or not up to the given number of hops, as an asynchronous
+    iterator over the chunks of the JSON document
+    """
+    graphs = await _dependency_graphs(brch, "redges")
+
+    found = {}
+    for repotype, dtbs in graphs:
+        async with pool.connect(dtbs.dtbsfile, dtbs.inode, LANE_SEARCH) as dtbsobjc:
+            async with dtbsobjc.execute(GET_SOURCE_PACKAGE_NAMES, (srcname,)) as dbcursor:
+                for item in await dbcursor.fetchall():
+                    found.setdefault(item[0], set()).add(repotype)
+    repos = await _graph_repos(graphs, found)
+    roots = {name: repotype for name, repotype in repos.items() if repotype in found[name]}
+    if not roots:
+        raise HTTPNotFound()
+
+    return _stream_impact(brch, graphs, srcname, roots, maxdepth)
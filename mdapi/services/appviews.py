@@ -21,12 +21,39 @@ License and may only be used or replicated with the express permission
 of Red Hat, Inc.
 """
 
+import json
 import os.path
+from email.utils import formatdate
 
-from aiohttp.web import FileResponse, HTTPBadRequest, json_response
+from aiohttp.web import (
+    FileResponse,
+    HTTPBadRequest,
+    HTTPNotModified,
+    Response,
+    StreamResponse,
+    json_response,
+)
 
 from mdapi.confdata import servlogr, standard
-from mdapi.services import _expand_package_info, _get_changelog, _get_files, _get_package
+from mdapi.database.base import REPOTYPES
+from mdapi.services import (
+    _expand_package_info,
+    _get_changelog,
+    _get_changelog_page,
+    _get_closure,
+    _get_file_owners,
+    _get_files,
+    _get_files_page,
+    _get_impact,
+    _get_package,
+    _get_package_everywhere,
+    _get_packages,
+    _search_packages,
+    _suggest_names,
+)
+from mdapi.services.catalog import catalog
+from mdapi.services.encoding import compress, compressor, negotiate
+from mdapi.services.respcache import respcache, searchcache
 
 homepage = os.path.join(os.path.dirname(os.path.abspath(__file__)), "homepage.html")
 
@@ -36,22 +63,192 @@ async def index(rqst):
     return FileResponse(homepage)
 
 
+def validation_headers(etag, lastmod):
+    return {"ETag": f'"{etag}"', "Last-Modified": formatdate(lastmod, usegmt=True)}
+
+
+def check_preconditions(rqst):
+    """
+    Raise a 304 if the client holds the current representation of a resource that was found, as
+    told by "If-None-Match: *" or by an "If-Modified-Since" date that is not older than the
+    databases, which hold whether the resource exists or not
+    """
+    if "validators" not in rqst:
+        return
+    etag, lastmod = rqst["validators"]
+    if rqst.if_none_match is not None:
+        if any(item.value == "*" for item in rqst.if_none_match):
+            raise HTTPNotModified(headers=validation_headers(etag, lastmod))
+    elif rqst.if_modified_since is not None:
+        if lastmod <= rqst.if_modified_since.timestamp():
+            raise HTTPNotModified(headers=validation_headers(etag, lastmod))
+
+
+async def _encoded_response(rqst, body, cachedrs=None, cache=respcache):
+    """
+    Return a JSON response with the body compressed with the encoding negotiated with the client,
+    the compressed forms of the cached responses are kept along with them in their cache
+    """
+    rspnobjc = Response(content_type="application/json", charset="utf-8")
+    rspnobjc.headers["Vary"] = "Accept-Encoding"
+    encoding = None
+    if len(body) >= standard.COMPRESSION["minimum"]:
+        encoding = negotiate(rqst.headers.get("Accept-Encoding"))
+    if encoding:
+        payload = cachedrs.encoded.get(encoding) if cachedrs else None
+        if payload is None:
+            payload = await compress(encoding, body)
+            if cachedrs:
+                cache.attach(cachedrs, encoding, payload)
+        rspnobjc.headers["Content-Encoding"] = encoding
+        body = payload
+    rspnobjc.body = body
+    return rspnobjc
+
+
+async def _cached_response(rqst, render, cache=respcache):
+    """
+    Return the response of the request from the given response cache, or render it with the
+    provided coroutine function and keep it for the next time
+    """
+    brch = rqst.match_info.get("brch")
+    stamp = catalog.stamp(brch)
+    cachedrs = cache.get(rqst.path_qs, stamp) if stamp else None
+    if cachedrs is not None:
+        body = cachedrs.body
+    else:
+        body = json.dumps(await render()).encode()
+        if stamp:
+            cachedrs = cache.put(rqst.path_qs, stamp, body)
+    return await _encoded_response(rqst, body, cachedrs, cache)
+
+
+async def _streamed_response(rqst, render):
+    """
+    Return the response of the request from the response cache, or stream the chunks of the JSON
+    document produced by the provided coroutine function while keeping them for the next time if
+    they fit in the cache
+    """
+    brch = rqst.match_info.get("brch")
+    stamp = catalog.stamp(brch)
+    cachedrs = respcache.get(rqst.path_qs, stamp) if stamp else None
+    if cachedrs is not None:
+        return await _encoded_response(rqst, cachedrs.body, cachedrs)
+
+    # Any error surfaces here, before the response starts
+    chunks = await render()
+    try:
+        check_preconditions(rqst)
+    except HTTPNotModified:
+        await chunks.aclose()
+        raise
+
+    rspnobjc = StreamResponse()
+    rspnobjc.content_type, rspnobjc.charset = "application/json", "utf-8"
+    rspnobjc.headers["Vary"] = "Accept-Encoding"
+    feed, finish = None, None
+    encoding = negotiate(rqst.headers.get("Accept-Encoding"))
+    if encoding:
+        feed, finish = compressor(encoding)
+        rspnobjc.headers["Content-Encoding"] = encoding
+
+    kept, keptsize = [] if stamp else None, 0
+    try:
+        await rspnobjc.prepare(rqst)
+        async for chunk in chunks:
+            if kept is not None:
+                keptsize += len(chunk)
+                kept = kept if keptsize <= standard.RESPONSE_CACHE["item"] else None
+                if kept is not None:
+                    kept.append(chunk)
+            data = feed(chunk) if feed else chunk
+            if data:
+                await rspnobjc.write(data)
+        if finish:
+            await rspnobjc.write(finish())
+        await rspnobjc.write_eof()
+    finally:
+        await chunks.aclose()
+
+    if kept is not None:
+        respcache.put(rqst.path_qs, stamp, b"".join(kept))
+    return rspnobjc
+
+
+def _lookup_params(rqst):
+    """
+    Return the repository the package is to be looked up in, or None for all of them, and whether
+    the latest of all the repositories having it is asked for rather than the first of them
+    """
+    repo, newest = rqst.query.get("repo"), rqst.query.get("newest", "0")
+    if repo is not None and repo not in [repotype or "release" for repotype in REPOTYPES]:
+        raise HTTPBadRequest()
+    if newest not in ("0", "1"):
+        raise HTTPBadRequest()
+    return (repo, newest == "1")
+
+
 async def get_pkg(rqst):
     servlogr.logrobjc.info(f"get_pkg {rqst}")
     brch = rqst.match_info.get("brch")
     name = rqst.match_info.get("name")
-    pckg, repotype = await _get_package(brch, name)
-    rslt = await _expand_package_info(pckg, brch, repotype)
-    return json_response(rslt)
+    repo, newest = _lookup_params(rqst)
+
+    async def render():
+        pckg, repotype = await _get_package(brch, name, repo=repo, newest=newest)
+        return await _expand_package_info(pckg, brch, repotype)
+
+    return await _cached_response(rqst, render)
+
+
+async def get_all_pkg(rqst):
+    """
+    Return the information about the given package in every branch, keyed by branch, with null
+    for the branches that do not have it
+    """
+    servlogr.logrobjc.info(f"get_all_pkg {rqst}")
+    name = rqst.match_info.get("name")
+
+    async def render():
+        return await _get_package_everywhere(name)
+
+    return await _cached_response(rqst, render)
 
 
 async def get_src_pkg(rqst):
     servlogr.logrobjc.info(f"get_src_pkg {rqst}")
     brch = rqst.match_info.get("brch")
     name = rqst.match_info.get("name")
-    pckg, repotype = await _get_package(brch, srcn=name)
-    rslt = await _expand_package_info(pckg, brch, repotype)
-    return json_response(rslt)
+    repo, newest = _lookup_params(rqst)
+
+    async def render():
+        pckg, repotype = await _get_package(brch, srcn=name, repo=repo, newest=newest)
+        return await _expand_package_info(pckg, brch, repotype)
+
+    return await _cached_response(rqst, render)
+
+
+async def get_pkgs(rqst):
+    """
+    Return the information about all the packages whose names are posted as a JSON list, the
+    names that are not found in the branch map to null
+    """
+    servlogr.logrobjc.info(f"get_pkgs {rqst}")
+    brch = rqst.match_info.get("brch")
+
+    try:
+        names = await rqst.json()
+    except ValueError:
+        raise HTTPBadRequest() from None
+    if (
+        not isinstance(names, list)
+        or not all(isinstance(name, str) and name for name in names)
+        or len(names) > standard.BULK_LIMIT
+    ):
+        raise HTTPBadRequest()
+
+    rslt = await _get_packages(brch, list(dict.fromkeys(names)))
+    return await _encoded_response(rqst, json.dumps(rslt).encode())
 
 
 async def list_branches(rqst):
@@ -59,17 +256,18 @@ async def list_branches(rqst):
     Return the list of all branches currently supported by mdapi
     """
     servlogr.logrobjc.info(f"list_branches {rqst}")
-    rslt = sorted(
-        {
-            # Remove the front part `mdapi-` and the end part `-<type>.sqlite` from the filenames
-            filename.replace("mdapi-", "").rsplit("-", 2)[0].replace("-updates", "")
-            for filename in os.listdir(standard.DB_FOLDER)
-            if filename.startswith("mdapi") and filename.endswith(".sqlite")
-        }
-    )
+    rslt = catalog.list_branches()
     return json_response(rslt)
 
 
+async def get_stats(rqst):
+    """
+    Return the counters of the response caches of this worker
+    """
+    servlogr.logrobjc.info(f"get_stats {rqst}")
+    return json_response({"cache": respcache.stats(), "search_cache": searchcache.stats()})
+
+
 async def _process_dep(rqst, actn):
     """
     Return the information about the packages having the specified action
@@ -85,7 +283,7 @@ async def _process_dep(rqst, actn):
         raise HTTPBadRequest  # noqa : B904
 
     rslt = await _expand_package_info(pckg, brch, repotype)
-    return json_response(rslt)
+    return await _encoded_response(rqst, json.dumps(rslt).encode())
 
 
 async def get_provides(rqst):
@@ -120,19 +318,173 @@ async def get_supplements(rqst):
     return await _process_dep(rqst, "supplements")
 
 
+def _page_params(rqst):
+    """
+    Return the limit, the date and the cursor requested for a paginated list or None if the
+    request does not ask for pagination
+    """
+    if not {"limit", "since", "cursor"}.intersection(rqst.query):
+        return None
+    try:
+        limit = int(rqst.query.get("limit", standard.PAGE_LIMIT))
+        since = int(rqst.query.get("since", 0))
+    except ValueError:
+        raise HTTPBadRequest() from None
+    if limit < 1:
+        raise HTTPBadRequest()
+    return (min(limit, standard.PAGE_LIMIT), since, rqst.query.get("cursor"))
+
+
 async def get_pkg_files(rqst):
     servlogr.logrobjc.info(f"get_pkg_files {rqst}")
     brch = rqst.match_info.get("brch")
     name = rqst.match_info.get("name")
-    pckg, repotype = await _get_package(brch, name)
-    rslt = await _get_files(pckg.pkgId, brch, repotype)
-    return json_response(rslt)
+    pageinfo = _page_params(rqst)
+
+    if pageinfo:
+        limit, _, cursor = pageinfo
+
+        async def render():
+            pckg, repotype = await _get_package(brch, name)
+            return await _get_files_page(pckg.pkgId, brch, repotype, limit, cursor)
+
+        return await _cached_response(rqst, render)
+
+    async def render():
+        pckg, repotype = await _get_package(brch, name)
+        return await _get_files(pckg.pkgId, brch, repotype)
+
+    return await _streamed_response(rqst, render)
 
 
 async def get_pkg_changelog(rqst):
     servlogr.logrobjc.info(f"get_pkg_changelog {rqst}")
     brch = rqst.match_info.get("brch")
     name = rqst.match_info.get("name")
-    pckg, repotype = await _get_package(brch, name)
-    rslt = await _get_changelog(pckg.pkgId, brch, repotype)
-    return json_response(rslt)
+    pageinfo = _page_params(rqst)
+
+    if pageinfo:
+        limit, since, cursor = pageinfo
+
+        async def render():
+            pckg, repotype = await _get_package(brch, name)
+            return await _get_changelog_page(pckg.pkgId, brch, repotype, limit, since, cursor)
+
+        return await _cached_response(rqst, render)
+
+    async def render():
+        pckg, repotype = await _get_package(brch, name)
+        return await _get_changelog(pckg.pkgId, brch, repotype)
+
+    return await _streamed_response(rqst, render)
+
+
+async def get_file_owners(rqst):
+    """
+    Return the packages shipping the file at the given path, or the files under the given
+    directory with the packages shipping them
+    """
+    servlogr.logrobjc.info(f"get_file_owners {rqst}")
+    brch = rqst.match_info.get("brch")
+    path, prefix = rqst.query.get("path"), rqst.query.get("prefix")
+    if bool(path) == bool(prefix) or not (path or prefix).startswith("/"):
+        raise HTTPBadRequest()
+    try:
+        limit = int(rqst.query.get("limit", standard.PAGE_LIMIT))
+    except ValueError:
+        raise HTTPBadRequest() from None
+    if limit < 1:
+        raise HTTPBadRequest()
+    limit = min(limit, standard.PAGE_LIMIT)
+
+    async def render():
+        if prefix:
+            return await _get_file_owners(brch, prefix.rstrip("/"), under=True, limit=limit)
+        return await _get_file_owners(brch, path, limit=limit)
+
+    return await _cached_response(rqst, render)
+
+
+async def search_packages(rqst):
+    """
+    Return the packages whose name, summary or description match the words of the query, the best
+    matches first, one page at a time
+    """
+    servlogr.logrobjc.info(f"search_packages {rqst}")
+    brch = rqst.match_info.get("brch")
+    text = rqst.query.get("q", "")
+    if not text.strip() or len(text) > standard.SEARCH["length"]:
+        raise HTTPBadRequest()
+    try:
+        limit = int(rqst.query.get("limit", standard.SEARCH["limit"]))
+        offset = int(rqst.query.get("cursor", 0))
+    except ValueError:
+        raise HTTPBadRequest() from None
+    if limit < 1 or offset < 0 or offset > standard.SEARCH["depth"]:
+        raise HTTPBadRequest()
+    limit = min(limit, standard.SEARCH["limit"])
+
+    async def render():
+        return await _search_packages(brch, text, limit, offset)
+
+    return await _cached_response(rqst, render, searchcache)
+
+
+async def suggest_names(rqst):
+    """
+    Return the package names the closest to the given fragment, for the misspelled or partial
+    names and for completing them as they are typed
+    """
+    servlogr.logrobjc.info(f"suggest_names {rqst}")
+    brch = rqst.match_info.get("brch")
+    fragment = rqst.match_info.get("fragment")
+    if len(fragment) > standard.SUGGEST["length"]:
+        raise HTTPBadRequest()
+    try:
+        limit = int(rqst.query.get("limit", standard.SUGGEST["limit"]))
+    except ValueError:
+        raise HTTPBadRequest() from None
+    if limit < 1:
+        raise HTTPBadRequest()
+    limit = min(limit, standard.SUGGEST["limit"])
+
+    async def render():
+        return {"suggestions": await _suggest_names(brch, fragment, limit)}
+
+    return await _cached_response(rqst, render, searchcache)
+
+
+async def get_closure(rqst):
+    """
+    Return all the packages the given package requires at runtime, directly or not
+    """
+    servlogr.logrobjc.info(f"get_closure {rqst}")
+    brch = rqst.match_info.get("brch")
+    name = rqst.match_info.get("name")
+
+    async def render():
+        return await _get_closure(brch, name)
+
+    return await _cached_response(rqst, render)
+
+
+async def get_impact(rqst):
+    """
+    Return the packages built from the given source package and all the packages requiring them at
+    runtime, directly or not, for knowing what a rebuild of the source package affects
+    """
+    servlogr.logrobjc.info(f"get_impact {rqst}")
+    brch = rqst.match_info.get("brch")
+    srcname = rqst.match_info.get("srcname")
+    try:
+        depth = int(rqst.query.get("depth", standard.IMPACT_DEPTH))
+    except ValueError:
+        raise HTTPBadRequest() from None
+    if depth < 0:
+        raise HTTPBadRequest()
+    depth = min(depth, standard.IMPACT_DEPTH)
+
+    async def render():
+        return await _get_impact(brch, srcname, depth)
+
+    return await _streamed_response(rqst, render)
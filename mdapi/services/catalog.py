@@ -0,0 +1,136 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+import os
+import time
+
+from mdapi.confdata import servlogr, standard
+from mdapi.database.base import KINDS, REPOTYPES, read_manifest, scan_databases, unified_sources
+
+# Name standing for all the branches at once in the requests spanning every one of them
+ALLBRANCHES = "all"
+
+
+class DatabaseCatalog:
+    """
+    Map every branch to the databases available for each of its repositories, so that the
+    requests do not have to probe the database directory.  The map is rebuilt whenever the
+    modification time of the database directory changes, which happens every time the ingest
+    step moves a new database in place, but this is checked at most once every CATALOG_REFRESH
+    seconds.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self.mtime = None
+        self.checked = 0.0
+        self.branches = {}
+        self.stamps = {}
+        self.modified = {}
+
+    def refresh(self, force=False):
+        moment = time.monotonic()
+        if (
+            not force
+            and self.folder == standard.DB_FOLDER
+            and moment - self.checked < standard.CATALOG_REFRESH
+        ):
+            return
+        self.checked = moment
+
+        try:
+            mtime = os.stat(standard.DB_FOLDER).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self.folder == standard.DB_FOLDER and self.mtime == mtime and mtime is not None:
+            return
+
+        manifest = read_manifest(standard.DB_FOLDER) if mtime is not None else {}
+        branches = scan_databases(standard.DB_FOLDER, manifest) if mtime is not None else {}
+
+        # A unified database is only used as long as none of the databases it was built from changed
+        for repolist in branches.values():
+            unified = repolist.get(None, {}).get("unified")
+            if unified and (
+                unified.checksum is None
+                or manifest[os.path.basename(unified.dtbsfile)].get("sources")
+                != unified_sources(repolist)
+            ):
+                servlogr.logrobjc.info(f"Ignoring the outdated {unified.dtbsfile}")
+                del repolist[None]["unified"]
+
+        # The stamp of a branch changes whenever any of its databases gets replaced
+        stamps = {
+            brch: "/".join(
+                dtbs.stamp if dtbs else "-"
+                for repotype in REPOTYPES
+                for dtbs in (repolist.get(repotype, {}).get(kind) for kind in KINDS)
+            )
+            for brch, repolist in branches.items()
+        }
+        stamps[None] = "/".join(sorted(branches))
+        stamps[ALLBRANCHES] = "|".join(f"{brch}:{stamps[brch]}" for brch in sorted(branches))
+        modified = {
+            brch: max(dtbs.mtime for dtbsdict in repolist.values() for dtbs in dtbsdict.values())
+            for brch, repolist in branches.items()
+        }
+        modified[ALLBRANCHES] = max(modified.values(), default=mtime)
+        modified[None] = mtime
+
+        servlogr.logrobjc.info(f"Catalogued databases of {len(branches)} branches")
+        self.folder, self.mtime, self.branches = standard.DB_FOLDER, mtime, branches
+        self.stamps, self.modified = stamps, modified
+
+    def branch(self, brch):
+        """
+        Return the databases of the given branch keyed by repository type and kind
+        """
+        self.refresh()
+        return self.branches.get(brch, {})
+
+    def stamp(self, brch):
+        """
+        Return a string identifying the current generation of the databases of the given branch,
+        of all of them for ALLBRANCHES, or of the list of branches if no branch is provided, or
+        None if the branch is not known
+        """
+        self.refresh()
+        return self.stamps.get(brch)
+
+    def last_modified(self, brch):
+        """
+        Return the time (in nanoseconds since the epoch) at which the databases of the given
+        branch, or the list of branches if no branch is provided, were last modified
+        """
+        self.refresh()
+        return self.modified.get(brch)
+
+    def locate(self, brch, repotype, kind):
+        return self.branch(brch).get(repotype, {}).get(kind)
+
+    def list_branches(self):
+        self.refresh()
+        return sorted(self.branches)
+
+
+catalog = DatabaseCatalog()
@@ -0,0 +1,131 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import aiosqlite
+
+from mdapi.confdata import servlogr
+from mdapi.database.sqlq import GET_SCHEMA
+
+# Lanes of connections, the package lookups use the default one and the searches their own
+LANE_DEFAULT = "default"
+
+LANE_SEARCH = "search"
+
+
+class PooledConnection:
+    def __init__(self, dtbsfile, lane, inode, dtbsobjc, schema):
+        self.dtbsfile = dtbsfile
+        self.lane = lane
+        self.inode = inode
+        self.dtbsobjc = dtbsobjc
+        self.schema = schema
+        self.users = 0
+        self.stale = False
+
+
+class ConnectionPool:
+    """
+    Keep one long-lived, read-only connection per database file and share it across all the
+    requests served by the worker.  The databases are installed by moving a new file over the
+    old one, so a change of inode tells us that the connection has to be reopened.
+
+    The queries on a connection run one after the other, so the heavier kinds of requests get
+    connections of their own, in another lane, and cannot hold up the package lookups.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    async def acquire(self, dtbsfile, inode=None, lane=LANE_DEFAULT):
+        if inode is None:
+            inode = os.stat(dtbsfile).st_ino
+        entry = self.entries.get((dtbsfile, lane))
+        if entry is not None and entry.inode == inode:
+            return entry
+
+        servlogr.logrobjc.info(f"Opening read-only connection to {dtbsfile} in the {lane} lane")
+        dtbsobjc = await aiosqlite.connect(f"{Path(dtbsfile).resolve().as_uri()}?mode=ro", uri=True)
+
+        # The tables and columns added at ingestion depend on the version of mdapi that indexed it
+        schema = {}
+        async with dtbsobjc.execute(GET_SCHEMA) as dbcursor:
+            for table, column in await dbcursor.fetchall():
+                schema.setdefault(table, set()).add(column)
+
+        # Another request might have reopened the same database while we were waiting
+        current = self.entries.get((dtbsfile, lane))
+        if current is not None and current.inode == inode:
+            await dtbsobjc.close()
+            return current
+
+        entry = PooledConnection(dtbsfile, lane, inode, dtbsobjc, schema)
+        self.entries[(dtbsfile, lane)] = entry
+        if current is not None:
+            await self.retire(current)
+        return entry
+
+    async def retire(self, entry):
+        """
+        Close the connection of a replaced database as soon as no request is using it anymore
+        """
+        entry.stale = True
+        if not entry.users:
+            servlogr.logrobjc.info(f"Closing connection to replaced {entry.dtbsfile}")
+            await entry.dtbsobjc.close()
+
+    async def schema(self, dtbsfile, inode=None):
+        """
+        Return the columns of every table of the database, keyed by table
+        """
+        return (await self.acquire(dtbsfile, inode)).schema
+
+    @asynccontextmanager
+    async def connect(self, dtbsfile, inode=None, lane=LANE_DEFAULT):
+        """
+        Yield the pooled connection to the database in the given lane, the inode known from the
+        catalog can be provided to spare a call to stat
+        """
+        entry = await self.acquire(dtbsfile, inode, lane)
+        entry.users += 1
+        try:
+            yield entry.dtbsobjc
+        finally:
+            entry.users -= 1
+            if entry.stale and not entry.users:
+                await entry.dtbsobjc.close()
+
+    async def close(self):
+        entries, self.entries = list(self.entries.values()), {}
+        for entry in entries:
+            await self.retire(entry)
+
+
+pool = ConnectionPool()
+
+
+async def close_connections(applobjc):
+    await pool.close()
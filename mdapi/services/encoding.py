@@ -0,0 +1,99 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+import asyncio
+import zlib
+
+import pyzstd
+
+from mdapi.confdata import standard
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings supported by the service, from the most preferred to the least preferred
+ENCODINGS = ["zstd", "br", "gzip"]
+
+
+def available_encodings():
+    return [
+        encoding
+        for encoding in ENCODINGS
+        if standard.COMPRESSION.get(encoding) is not None and (encoding != "br" or brotli)
+    ]
+
+
+def negotiate(acptencd):
+    """
+    Return the encoding to use for a response, given the Accept-Encoding header of the request,
+    or None if the response is to be sent as it is
+    """
+    weights = {}
+    for item in (acptencd or "").split(","):
+        token, *params = (part.strip() for part in item.split(";"))
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[token.lower()] = weight
+
+    choice, choiceweight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > choiceweight:
+            choice, choiceweight = encoding, weight
+    return choice
+
+
+def compressor(encoding):
+    """
+    Return the functions feeding data to a streaming compressor and finishing the stream
+    """
+    level = standard.COMPRESSION[encoding]
+    if encoding == "gzip":
+        compobjc = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compobjc.compress, compobjc.flush
+    if encoding == "br":
+        compobjc = brotli.Compressor(quality=level)
+        return compobjc.process, compobjc.finish
+    compobjc = pyzstd.ZstdCompressor(level)
+    return compobjc.compress, compobjc.flush
+
+
+def compress_body(encoding, body):
+    feed, finish = compressor(encoding)
+    return feed(body) + finish()
+
+
+async def compress(encoding, body):
+    """
+    Compress the body away from the event loop, the compressors release the GIL while working
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, compress_body, encoding, body)
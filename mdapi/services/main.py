@@ -21,25 +21,39 @@ License and may only be used or replicated with the express permission
 of Red Hat, Inc.
 """
 
-from aiohttp.web import Application, HTTPException, get, middleware
+import hashlib
+
+from aiohttp.web import Application, HTTPException, HTTPNotModified, get, middleware, post
 
 from mdapi.confdata import servlogr
 from mdapi.services.appviews import (
+    check_preconditions,
+    get_all_pkg,
+    get_closure,
     get_conflicts,
     get_enhances,
+    get_file_owners,
+    get_impact,
     get_obsoletes,
     get_pkg,
     get_pkg_changelog,
     get_pkg_files,
+    get_pkgs,
     get_provides,
     get_recommends,
     get_requires,
     get_src_pkg,
+    get_stats,
     get_suggests,
     get_supplements,
     index,
     list_branches,
+    search_packages,
+    suggest_names,
+    validation_headers,
 )
+from mdapi.services.catalog import ALLBRANCHES, catalog
+from mdapi.services.connpool import close_connections
 
 
 @middleware
@@ -48,25 +62,73 @@ async def add_cors_headers(request, handler):
         response = await handler(request)
     except HTTPException as excp:
         excp.headers["Access-Control-Allow-Origin"] = "*"
-        excp.headers["Access-Control-Allow-Methods"] = "GET"
+        excp.headers["Access-Control-Allow-Methods"] = "GET, POST"
         raise
     response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST"
+    return response
+
+
+@middleware
+async def conditional_get(request, handler):
+    """
+    Validate the requests against the stamp of the databases of the branch they query, so that the
+    clients already holding the current representation get a 304 without touching the databases
+    """
+    if request.method not in ("GET", "HEAD") or (
+        "brch" not in request.match_info and request.path != "/branches"
+    ):
+        return await handler(request)
+
+    brch = request.match_info.get("brch")
+    stamp = catalog.stamp(brch)
+    if stamp is None:
+        return await handler(request)
+
+    etag = hashlib.sha256(f"{stamp} {request.path_qs}".encode()).hexdigest()
+    lastmod = (catalog.last_modified(brch) or 0) // 10**9
+    request["validators"] = (etag, lastmod)
+    if request.if_none_match is not None:
+        # The ETags are only issued with successful responses, so a matching one means that the
+        # resource exists - the compressed representations carry the encoding after the stamp
+        for item in request.if_none_match:
+            if item.value.partition("-")[0] == etag:
+                raise HTTPNotModified(headers=validation_headers(item.value, lastmod))
+
+    response = await handler(request)
+
+    # The streamed responses evaluate the other conditions themselves before they start
+    if response.status == 200 and not response.prepared:
+        check_preconditions(request)
     return response
 
 
+async def add_validators(request, response):
+    if "validators" in request and response.status == 200:
+        etag, lastmod = request["validators"]
+        if "Content-Encoding" in response.headers:
+            etag = f"{etag}-{response.headers['Content-Encoding']}"
+        response.etag, response.last_modified = etag, lastmod
+
+
 async def buildapp():
     """
     Creates an aiohttp web application
     This function creates a web application, configures the routes and returns the application
     object.
     """
-    applobjc = Application(middlewares=[add_cors_headers], logger=servlogr.logrobjc)
+    applobjc = Application(
+        middlewares=[add_cors_headers, conditional_get], logger=servlogr.logrobjc
+    )
     applobjc.add_routes(
         [
             get("/", index),
             get("/branches", list_branches),
+            get("/stats", get_stats),
+            # Registered ahead of the branch routes so that it is not taken for a branch name
+            get(f"/{{brch:{ALLBRANCHES}}}/pkg/{{name}}", get_all_pkg),
             get("/{brch}/pkg/{name}", get_pkg),
+            post("/{brch}/pkgs", get_pkgs),
             get("/{brch}/srcpkg/{name}", get_src_pkg),
             get("/{brch}/provides/{name}", get_provides),
             get("/{brch}/requires/{name}", get_requires),
@@ -78,6 +140,14 @@ async def buildapp():
             get("/{brch}/supplements/{name}", get_supplements),
             get("/{brch}/files/{name}", get_pkg_files),
             get("/{brch}/changelog/{name}", get_pkg_changelog),
+            get("/{brch}/whatprovidesfile", get_file_owners),
+            get("/{brch}/search", search_packages),
+            get("/{brch}/suggest/{fragment}", suggest_names),
+            get("/{brch}/closure/{name}", get_closure),
+            get("/{brch}/impact/{srcname}", get_impact),
         ]
     )
+    applobjc.on_response_prepare.append(add_validators)
+    applobjc.on_cleanup.append(close_connections)
+    catalog.refresh(force=True)
     return applobjc
@@ -0,0 +1,117 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+from collections import OrderedDict
+
+from mdapi.confdata import standard
+
+
+class CachedResponse:
+    def __init__(self, key, stamp, body):
+        self.key = key
+        self.stamp = stamp
+        self.body = body
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(payload) for payload in self.encoded.values())
+
+
+class ResponseCache:
+    """
+    Bounded least-recently-used cache of the rendered JSON responses.  Every entry remembers the
+    stamp of the branch databases it was rendered from and is dropped as soon as the stamp of the
+    branch changes, which is when the ingest step has replaced one of its databases.  It is bounded
+    by the setting of the given name.
+    """
+
+    def __init__(self, setting="RESPONSE_CACHE"):
+        self.setting = setting
+        self.entries = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, stamp):
+        item = self.entries.get(key)
+        if item is not None and item.stamp != stamp:
+            self.discard(key)
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return item
+
+    @property
+    def limits(self):
+        return getattr(standard, self.setting)
+
+    def put(self, key, stamp, body):
+        if not self.limits["entries"] or len(body) > self.limits["item"]:
+            return
+        self.discard(key)
+        item = CachedResponse(key, stamp, body)
+        self.entries[key] = item
+        self.memory += item.size
+        self.shrink()
+        return item
+
+    def attach(self, item, encoding, payload):
+        """
+        Keep the compressed form of a cached response so that it is only compressed once
+        """
+        if self.entries.get(item.key) is not item or encoding in item.encoded:
+            return
+        item.encoded[encoding] = payload
+        self.memory += len(payload)
+        self.shrink()
+
+    def shrink(self):
+        while self.entries and (
+            len(self.entries) > self.limits["entries"]
+            or self.memory > self.limits["memory"]
+        ):
+            self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        item = self.entries.pop(key, None)
+        if item is not None:
+            self.memory -= item.size
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "memory": self.memory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+respcache = ResponseCache()
+
+searchcache = ResponseCache("SEARCH_CACHE")
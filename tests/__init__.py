@@ -21,13 +21,16 @@ License and may only be used or replicated with the express permission
 of Red Hat, Inc.
 """
 
+import hashlib
 import os.path
+import sqlite3
 from tempfile import TemporaryDirectory
 
 import requests
 from bs4 import BeautifulSoup
 
 from mdapi.confdata import standard
+from mdapi.database.base import index_database
 
 """
 Standard set of databases to run tests against
@@ -74,3 +77,96 @@ def populate_permalinks():
                     linklist.append(f"{PROBEURL[indx]}{jndx.get('href')}")
         linkdict[indx] = linklist
     return linkdict
+
+
+"""
+Handcrafted set of databases to run tests against without downloading anything
+"""
+
+SAMPLEPKG = {
+    "release": [
+        # name, epoch, version, release, source, requires, provides, files, changelogs
+        ("bash", "0", "5.2.26", "1.fc99", "bash-5.2.26-1.fc99.src.rpm", ["glibc"], ["bash", "/bin/sh"], {"/usr/bin": ["bash", "sh"], "/usr/share/doc/bash": ["README"]}, [("Tux <tux@example.com> - 5.2.26-1", 1700000000, "- Update to 5.2.26"), ("Tux <tux@example.com> - 5.2.25-1", 1690000000, "- Update to 5.2.25"), ("Tux <tux@example.com> - 5.2.24-1", 1680000000, "- Update to 5.2.24")]),  # noqa : E501
+        ("glibc", "0", "2.39", "1.fc99", "glibc-2.39-1.fc99.src.rpm", [], ["glibc", "libc.so.6()(64bit)"], {"/usr/lib64": ["libc.so.6"]}, [("Tux <tux@example.com> - 2.39-1", 1700000000, "- Update to 2.39")]),  # noqa : E501
+        ("glibc-common", "0", "2.39", "1.fc99", "glibc-2.39-1.fc99.src.rpm", ["glibc"], ["glibc-common"], {"/usr/bin": ["ldd"]}, []),  # noqa : E501
+        ("python3", "0", "3.12.1", "1.fc99", "python3.12-3.12.1-1.fc99.src.rpm", ["python3-libs", "libc.so.6()(64bit)"], ["python3"], {"/usr/bin": ["python3"]}, []),  # noqa : E501
+        ("python3-libs", "0", "3.12.1", "1.fc99", "python3.12-3.12.1-1.fc99.src.rpm", ["glibc", "/bin/sh"], ["python3-libs"], {"/usr/lib64/python3.12": ["os.py", "re.py"]}, []),  # noqa : E501
+        ("python3-natsort", "0", "8.4.0", "1.fc99", "python-natsort-8.4.0-1.fc99.src.rpm", ["python3"], ["python3-natsort", "python3dist(natsort)"], {"/usr/lib/python3.12/site-packages/natsort": ["__init__.py"]}, []),  # noqa : E501
+        ("foo", "0", "1.9", "1.fc99", "foo-1.9-1.fc99.src.rpm", [], ["foo"], {}, []),
+        ("foo", "0", "1.10", "1.fc99", "foo-1.10-1.fc99.src.rpm", [], ["foo"], {}, []),
+        ("foo-bar", "0", "2.0", "1.fc99", "foo-bar-2.0-1.fc99.src.rpm", ["foo"], ["foo-bar"], {}, []),  # noqa : E501
+    ],
+    "updates": [
+        ("bash", "0", "5.2.26", "2.fc99", "bash-5.2.26-2.fc99.src.rpm", ["glibc"], ["bash", "/bin/sh"], {"/usr/bin": ["bash", "sh"]}, [("Tux <tux@example.com> - 5.2.26-2", 1710000000, "- Rebuild")]),  # noqa : E501
+    ],
+}
+
+RELATIONS = [
+    "conflicts",
+    "obsoletes",
+    "provides",
+    "requires",
+    "enhances",
+    "recommends",
+    "suggests",
+    "supplements",
+]
+
+
+def fabricate_databases(location, brchname="f99", indexed=True):
+    """
+    Write a small set of primary, filelists and other databases of the given branch in the
+    layout that createrepo_c uses, so that the service can be tested without downloading, and
+    index them like the ingest step does unless they are to be published for it
+    """
+    for repotype, pkgslist in SAMPLEPKG.items():
+        prefix = f"{location}/mdapi-{brchname}" if repotype == "release" else f"{location}/mdapi-{brchname}-{repotype}"  # noqa : E501
+        prmyobjc = sqlite3.connect(f"{prefix}-primary.sqlite")
+        flstobjc = sqlite3.connect(f"{prefix}-filelists.sqlite")
+        othrobjc = sqlite3.connect(f"{prefix}-other.sqlite")
+        prmyobjc.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+        prmyobjc.execute("CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT, name TEXT, arch TEXT, version TEXT, epoch TEXT, release TEXT, summary TEXT, description TEXT, url TEXT, rpm_sourcerpm TEXT)")  # noqa : E501
+        prmyobjc.execute("CREATE INDEX packagename ON packages (name)")
+        prmyobjc.execute("CREATE INDEX packageId ON packages (pkgId)")
+        prmyobjc.execute("CREATE TABLE files (name TEXT, type TEXT, pkgKey INTEGER)")
+        for relation in RELATIONS:
+            prmyobjc.execute(f"CREATE TABLE {relation} (name TEXT, flags TEXT, epoch TEXT, version TEXT, release TEXT, pkgKey INTEGER)")  # noqa : E501
+        for objc in (flstobjc, othrobjc):
+            objc.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+            objc.execute("CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT)")
+        flstobjc.execute("CREATE TABLE filelist (pkgKey INTEGER, dirname TEXT, filenames TEXT, filetypes TEXT)")  # noqa : E501
+        othrobjc.execute("CREATE TABLE changelog (pkgKey INTEGER, author TEXT, date INTEGER, changelog TEXT)")  # noqa : E501
+        for pkgKey, item in enumerate(pkgslist, start=1):
+            name, epoch, version, release, source, requires, provides, files, changelogs = item
+            pkgId = hashlib.sha256(f"{repotype}-{name}-{version}-{release}".encode()).hexdigest()
+            prmyobjc.execute(
+                "INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (pkgKey, pkgId, name, "x86_64", version, epoch, release, f"The {name} package", f"This is the {name} package.", f"https://example.com/{name}", source),  # noqa : E501
+            )
+            for relation, capslist in (("requires", requires), ("provides", provides)):
+                for caps in capslist:
+                    prmyobjc.execute(
+                        f"INSERT INTO {relation} VALUES (?, ?, ?, ?, ?, ?)",  # noqa : S608
+                        (caps, None, None, None, None, pkgKey),
+                    )
+            for dirname, filenames in files.items():
+                for filename in filenames:
+                    prmyobjc.execute(
+                        "INSERT INTO files VALUES (?, ?, ?)",
+                        (f"{dirname}/{filename}", "file", pkgKey),
+                    )
+                flstobjc.execute(
+                    "INSERT INTO filelist VALUES (?, ?, ?, ?)",
+                    (pkgKey, dirname, "/".join(filenames), "f" * len(filenames)),
+                )
+            for objc in (flstobjc, othrobjc):
+                objc.execute("INSERT INTO packages VALUES (?, ?)", (pkgKey, pkgId))
+            for author, date, changelog in changelogs:
+                othrobjc.execute(
+                    "INSERT INTO changelog VALUES (?, ?, ?, ?)", (pkgKey, author, date, changelog)
+                )
+        for objc, kind in ((prmyobjc, "primary"), (flstobjc, "filelists"), (othrobjc, "other")):
+            objc.commit()
+            objc.close()
+            if indexed:
+                index_database(brchname, f"{prefix}-{kind}.sqlite")
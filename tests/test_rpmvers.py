@@ -0,0 +1,72 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+import pytest
+
+from mdapi.database.rpmvers import evr_key, version_key
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "older, newer",
+    [
+        pytest.param("1.9", "1.10", id="Numeric segments"),
+        pytest.param("2.0", "2.0.1", id="Longer version"),
+        pytest.param("2.0.1", "2.0.1a", id="Trailing letters"),
+        pytest.param("5.5p1", "5.5p10", id="Mixed segments"),
+        pytest.param("xyz.4", "8", id="Letters before digits"),
+        pytest.param("6.0", "6.0.rc1", id="Release candidate"),
+        pytest.param("1.0a", "1.0aa", id="Longer letters"),
+        pytest.param("10.0001", "10.0039", id="Leading zeros"),
+        pytest.param("4.999.9", "5.0", id="Major version"),
+        pytest.param("1.0~rc1", "1.0", id="Tilde"),
+        pytest.param("1.0~rc1~git123", "1.0~rc1", id="Tildes"),
+        pytest.param("1.0", "1.0^", id="Caret"),
+        pytest.param("1.0^git1", "1.01", id="Caret before segment"),
+        pytest.param("1.0^20160101^git1", "1.0^20160102", id="Carets"),
+        pytest.param("1.0^git1~pre", "1.0^git1", id="Caret and tilde"),
+    ],
+)
+def test_version_key_order(older, newer):
+    assert version_key(older) < version_key(newer)  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "same",
+    [
+        pytest.param(("10.0001", "10.1"), id="Leading zeros"),
+        pytest.param(("2.0", "2_0"), id="Separators"),
+        pytest.param(("a+", "a_"), id="Trailing separators"),
+    ],
+)
+def test_version_key_equal(same):
+    assert version_key(same[0]) == version_key(same[1])  # noqa : S101
+
+
+@pytest.mark.download_needless
+def test_evr_key_order():
+    assert evr_key("0", "2.0", "1.fc99") < evr_key("1", "1.0", "1.fc99")  # noqa : S101
+    assert evr_key(None, "2.0", "1.fc99") == evr_key("0", "2.0", "1.fc99")  # noqa : S101
+    assert evr_key("0", "2.0", "1.fc99") < evr_key("0", "2.0", "2.fc99")  # noqa : S101
+    assert evr_key("0", "2.0", "10.fc99") < evr_key("0", "2.0.1", "1.fc99")  # noqa : S101
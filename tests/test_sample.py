@@ -0,0 +1,1120 @@
+"""
+mdapi
+Copyright (C) 2015-2022 Red Hat, Inc.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Any Red Hat trademarks that are incorporated in the source
+code or documentation are not subject to the GNU General Public
+License and may only be used or replicated with the express permission
+of Red Hat, Inc.
+"""
+
+import bz2
+import functools
+import gzip
+import hashlib
+import http.server
+import json
+import lzma
+import os
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiosqlite
+import pytest
+import pyzstd
+
+import mdapi.database.main
+import mdapi.services
+import tests
+from mdapi.confdata import standard
+from mdapi.database.base import (
+    compare_databases,
+    index_database,
+    parse_filename,
+    read_manifest,
+    record_manifest,
+)
+from mdapi.database.main import extract_database, fetch_database, stream_database
+from mdapi.database.rpmvers import evr_key
+from mdapi.database.sqlq import GET_PACKAGE_BY, GET_PROVIDERS, ORDER_BY_EVR_KEY
+from mdapi.services.catalog import catalog
+from mdapi.services.connpool import LANE_DEFAULT, pool
+from mdapi.services.encoding import negotiate
+from mdapi.services.main import buildapp
+
+
+@pytest.fixture
+def sample_location(tmp_path):
+    tests.fabricate_databases(str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.mark.download_needless
+def test_compare_databases_sample(sample_location):
+    tests.fabricate_databases(sample_location, "f98")
+    dtbsfile = os.path.join(sample_location, "mdapi-f98-primary.sqlite")
+    with sqlite3.connect(dtbsfile) as connobjc:
+        connobjc.execute("DROP TABLE sqlite_stat1")
+    connobjc.close()
+    dtbsothr = os.path.join(sample_location, "mdapi-f99-primary.sqlite")
+    assert compare_databases("f99", dtbsothr, dtbsfile, {}, {}).main() == set()  # noqa : S101
+
+    # The tables derived at ingestion are left out as well
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-filelists.sqlite")
+    cmprobjc = compare_databases("f99", dtbsfile, dtbsfile, {}, {})
+    assert sorted(cmprobjc.obtain_table_names(dtbsfile)) == ["filelist", "packages"]  # noqa : S101
+
+
+@pytest.fixture
+async def testing_application_sample(sample_location, event_loop, aiohttp_client):
+    standard.DB_FOLDER = sample_location
+    applobjc = await buildapp()
+    return await aiohttp_client(applobjc)
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "filename, identity",
+    [
+        ("mdapi-f40-primary.sqlite", ("f40", None, "primary")),
+        ("mdapi-f40-updates-testing-other.sqlite", ("f40", "updates-testing", "other")),
+        ("mdapi-f40-updates-filelists.sqlite", ("f40", "updates", "filelists")),
+        ("mdapi-epel9-next-primary.sqlite", ("epel9-next", None, "primary")),
+        ("mdapi-epel9-next-testing-primary.sqlite", ("epel9-next", "testing", "primary")),
+        ("mdapi-src_rawhide-other.sqlite", ("src_rawhide", None, "other")),
+        ("mdapi-tempdrct-0123abcd", None),
+        ("mdapi-f40-primary.sqlite.xz", None),
+    ],
+)
+def test_parse_filename(filename, identity):
+    assert parse_filename(filename) == identity  # noqa : S101
+
+
+@pytest.mark.download_needless
+def test_index_database_sample(sample_location):
+    with sqlite3.connect(os.path.join(sample_location, "mdapi-f99-primary.sqlite")) as connobjc:
+        sqlquery = GET_PACKAGE_BY.format("requires", order=ORDER_BY_EVR_KEY.format("p."))
+        planlist = [item[3] for item in connobjc.execute(f"EXPLAIN QUERY PLAN {sqlquery}", ("x",))]
+        assert "SEARCH t USING INDEX requiresName (name=?)" in planlist  # noqa : S101
+        assert connobjc.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0]  # noqa : S101
+
+    # An index over the same columns as one created by createrepo_c is not created again
+    dtbsfile = os.path.join(sample_location, "mdapi-f97-other.sqlite")
+    with sqlite3.connect(dtbsfile) as connobjc:
+        connobjc.execute("CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT)")
+        connobjc.execute("CREATE INDEX pkgId ON packages (pkgId)")
+    connobjc.close()
+    index_database("f97", dtbsfile)
+    with sqlite3.connect(dtbsfile) as connobjc:
+        sqlquery = "SELECT name FROM sqlite_master WHERE type = 'index'"
+        assert [item[0] for item in connobjc.execute(sqlquery)] == ["pkgId"]  # noqa : S101
+    connobjc.close()
+
+
+@pytest.mark.download_needless
+async def test_view_branches_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/branches")
+    assert respobjc.status == 200  # noqa : S101
+    assert await respobjc.json() == ["f99"]  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_pkg_sample_unknown_branch(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f98/pkg/bash")
+    assert respobjc.status == 400  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_pkg_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/pkg/bash")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert otptobjc["release"] == "2.fc99"  # noqa : S101
+    assert otptobjc["repo"] == "updates"  # noqa : S101
+    assert [item["name"] for item in otptobjc["requires"]] == ["glibc"]  # noqa : S101
+    assert otptobjc["co-packages"] == ["bash"]  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_pkg_sample_latest(testing_application_sample, sample_location):
+    respobjc = await testing_application_sample.get("/f99/pkg/foo")
+    assert (await respobjc.json())["version"] == "1.10"  # noqa : S101
+
+    # The databases indexed before the sortable key was introduced are still served
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-primary.sqlite")
+    with sqlite3.connect(dtbsfile) as connobjc:
+        connobjc.execute("DROP INDEX packageEvr")
+        connobjc.execute("ALTER TABLE packages DROP COLUMN evr_key")
+    shutil.copy(dtbsfile, f"{dtbsfile}.new")
+    shutil.move(f"{dtbsfile}.new", dtbsfile)
+    catalog.refresh(force=True)
+    respobjc = await testing_application_sample.get("/f99/pkg/foo")
+    assert respobjc.status == 200  # noqa : S101
+    assert (await respobjc.json())["version"] == "1.9"  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "srcname, name, version",
+    [
+        pytest.param("foo", "foo", "1.10", id="Named after the source"),
+        pytest.param("foo-bar", "foo-bar", "2.0", id="Longer source name"),
+        pytest.param("python3.12", "python3", "3.12.1", id="Dotted source name"),
+        pytest.param("python-natsort", "python3-natsort", "8.4.0", id="Renamed package"),
+    ],
+)
+async def test_view_src_pkg_sample(testing_application_sample, srcname, name, version):
+    respobjc = await testing_application_sample.get(f"/f99/srcpkg/{srcname}")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert (otptobjc["basename"], otptobjc["version"]) == (srcname, version)  # noqa : S101
+    assert name in otptobjc["co-packages"]  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/srcpkg/fo")
+    assert respobjc.status == 404  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize("unified", [False, True], ids=["By repository", "Unified"])
+async def test_view_pkg_sample_repo(testing_application_sample, sample_location, unified):
+    # Make the package in the updates older than the one in the release
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-updates-primary.sqlite")
+    with sqlite3.connect(dtbsfile) as connobjc:
+        sqlquery = "UPDATE packages SET release = ?, evr_key = ? WHERE name = 'bash'"
+        connobjc.execute(sqlquery, ("0.fc99", evr_key("0", "5.2.26", "0.fc99")))
+    shutil.copy(dtbsfile, f"{dtbsfile}.new")
+    shutil.move(f"{dtbsfile}.new", dtbsfile)
+    if unified:
+        mdapi.database.main.unify_branches()
+    catalog.refresh(force=True)
+    assert (catalog.locate("f99", None, "unified") is not None) == unified  # noqa : S101
+
+    for path, repo, evr in [
+        ("/f99/pkg/bash", "updates", "5.2.26-0.fc99"),
+        ("/f99/pkg/bash?newest=0", "updates", "5.2.26-0.fc99"),
+        ("/f99/pkg/bash?newest=1", "release", "5.2.26-1.fc99"),
+        ("/f99/pkg/bash?repo=release", "release", "5.2.26-1.fc99"),
+        ("/f99/pkg/bash?repo=updates&newest=1", "updates", "5.2.26-0.fc99"),
+        ("/f99/pkg/foo?newest=1", "release", "1.10-1.fc99"),
+        ("/f99/srcpkg/bash?newest=1", "release", "5.2.26-1.fc99"),
+        ("/f99/srcpkg/bash?repo=updates", "updates", "5.2.26-0.fc99"),
+        ("/f99/srcpkg/python3.12?repo=release", "release", "3.12.1-1.fc99"),
+    ]:
+        respobjc = await testing_application_sample.get(path)
+        assert respobjc.status == 200  # noqa : S101
+        otptobjc = await respobjc.json()
+        assert otptobjc["repo"] == repo  # noqa : S101
+        assert f"{otptobjc['version']}-{otptobjc['release']}" == evr  # noqa : S101
+
+    for path, status in [
+        ("/f99/pkg/glibc?repo=updates", 404),
+        ("/f99/pkg/glibc?repo=testing", 404),
+        ("/f99/srcpkg/python3.12?repo=updates", 404),
+        ("/f99/pkg/bash?repo=rawhide", 400),
+        ("/f99/pkg/bash?newest=yes", 400),
+        ("/f99/srcpkg/bash?repo=", 400),
+    ]:
+        respobjc = await testing_application_sample.get(path)
+        assert respobjc.status == status  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_pkg_sample_invalid(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/pkg/invalidpackagename")
+    assert respobjc.status == 404  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize("chunk", [1, 100])
+async def test_view_provides_sample_batched(testing_application_sample, monkeypatch, chunk):
+    monkeypatch.setattr(mdapi.services, "EXPAND_CHUNK", chunk)
+    respobjc = await testing_application_sample.get("/f99/requires/glibc")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert [item["basename"] for item in otptobjc] == ["bash"]  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/provides/foo")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert sorted(item["version"] for item in otptobjc) == ["1.10", "1.9"]  # noqa : S101
+    for item in otptobjc:
+        assert [dept["name"] for dept in item["provides"]] == ["foo"]  # noqa : S101
+        assert item["co-packages"] == ["foo"]  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize("limit", [1, 8])
+async def test_view_all_pkg_sample(testing_application_sample, sample_location, monkeypatch, limit):
+    monkeypatch.setattr(standard, "FANOUT_LIMIT", limit)
+    tests.fabricate_databases(sample_location, "f98")
+    os.remove(os.path.join(sample_location, "mdapi-f98-updates-primary.sqlite"))
+    catalog.refresh(force=True)
+
+    respobjc = await testing_application_sample.get("/all/pkg/bash")
+    assert respobjc.status == 200  # noqa : S101
+    etag, otptobjc = respobjc.headers["ETag"], await respobjc.json()
+    assert list(otptobjc) == ["f98", "f99"]  # noqa : S101
+    for brch in ("f98", "f99"):
+        respobjc = await testing_application_sample.get(f"/{brch}/pkg/bash")
+        assert otptobjc[brch] == await respobjc.json()  # noqa : S101
+    assert otptobjc["f98"]["repo"] == "release"  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/all/pkg/nothing")
+    assert await respobjc.json() == {"f98": None, "f99": None}  # noqa : S101
+
+    # Replacing the databases of any branch changes the validators
+    os.remove(os.path.join(sample_location, "mdapi-f98-other.sqlite"))
+    catalog.refresh(force=True)
+    respobjc = await testing_application_sample.get(
+        "/all/pkg/bash", headers={"If-None-Match": etag}
+    )
+    assert respobjc.status == 200  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_select_in_sample_bound(testing_application_sample, monkeypatch):
+    bound = []
+    execute = aiosqlite.Connection.execute
+
+    def counted_execute(self, sqlquery, parameters=None):
+        bound.append(len(parameters or ()))
+        return execute(self, sqlquery, parameters)
+
+    # The names are bound twice in the query, which must not take more parameters than allowed
+    monkeypatch.setattr(aiosqlite.Connection, "execute", counted_execute)
+    monkeypatch.setattr(mdapi.services, "LOOKUP_CHUNK", 2)
+    dtbs = catalog.locate("f99", None, "primary")
+    rowslist = await mdapi.services._select_in(
+        dtbs, GET_PROVIDERS, "names", ["bash", "/bin/sh", "/usr/bin/python3"]
+    )
+    assert sorted(rowslist) == [  # noqa : S101
+        ("/bin/sh", "bash"),
+        ("/usr/bin/python3", "python3"),
+        ("bash", "bash"),
+    ]
+    assert max(bound) == 2  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize("chunk", [1, 500])
+async def test_view_pkgs_sample(testing_application_sample, monkeypatch, chunk):
+    monkeypatch.setattr(mdapi.services, "LOOKUP_CHUNK", chunk)
+    names = ["bash", "foo", "python3", "nothing", "glibc", "bash"]
+    respobjc = await testing_application_sample.post("/f99/pkgs", json=names)
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert list(otptobjc) == ["bash", "foo", "python3", "nothing", "glibc"]  # noqa : S101
+    assert otptobjc["nothing"] is None  # noqa : S101
+    assert otptobjc["bash"]["repo"] == "updates"  # noqa : S101
+    assert otptobjc["glibc"]["repo"] == "release"  # noqa : S101
+
+    # Every package is described just like the single lookups do
+    for name in ("bash", "foo", "python3", "glibc"):
+        respobjc = await testing_application_sample.get(f"/f99/pkg/{name}")
+        assert otptobjc[name] == await respobjc.json()  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "path, data",
+    [
+        pytest.param("/f99/pkgs", "bash", id="Not a JSON document"),
+        pytest.param("/f99/pkgs", '{"name": "bash"}', id="Not a list"),
+        pytest.param("/f99/pkgs", '["bash", 1]', id="Not a name"),
+        pytest.param("/f99/pkgs", json.dumps(["bash"] * 2001), id="Too many names"),
+        pytest.param("/f98/pkgs", '["bash"]', id="Unknown branch"),
+    ],
+)
+async def test_view_pkgs_sample_invalid(testing_application_sample, path, data):
+    respobjc = await testing_application_sample.post(path, data=data)
+    assert respobjc.status == 400  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_files_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/files/glibc")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert otptobjc["files"] == [  # noqa : S101
+        {"dirname": "/usr/lib64", "filenames": "libc.so.6", "filetypes": "f"}
+    ]
+    assert otptobjc["repo"] == "release"  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize("chunk", [1, 256])
+async def test_view_streamed_sample(testing_application_sample, monkeypatch, chunk):
+    monkeypatch.setattr(mdapi.services, "STREAM_CHUNK", chunk)
+    expected = {
+        "changelogs": [
+            {
+                "author": "Tux <tux@example.com> - 5.2.26-1",
+                "changelog": "- Update to 5.2.26",
+                "date": 1700000000,
+            },
+            {
+                "author": "Tux <tux@example.com> - 5.2.25-1",
+                "changelog": "- Update to 5.2.25",
+                "date": 1690000000,
+            },
+            {
+                "author": "Tux <tux@example.com> - 5.2.24-1",
+                "changelog": "- Update to 5.2.24",
+                "date": 1680000000,
+            },
+        ],
+        "repo": "release",
+    }
+
+    # Stream the document once and then serve it from the response cache
+    for _ in range(2):
+        respobjc = await testing_application_sample.get(
+            "/f99/changelog/glibc-common", headers={"Accept-Encoding": "identity"}
+        )
+        assert respobjc.status == 200  # noqa : S101
+        assert respobjc.content_type == "application/json"  # noqa : S101
+        otptobjc = await respobjc.text()
+        assert json.loads(otptobjc)["changelogs"] == []  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/changelog/bash")
+    assert json.loads(await respobjc.text())["repo"] == "updates"  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/files/glibc-common")
+    assert json.loads(await respobjc.text())["files"][0]["filenames"] == "ldd"  # noqa : S101
+
+    # The release repository is only looked at for the packages without updates
+    os.remove(os.path.join(standard.DB_FOLDER, "mdapi-f99-updates-primary.sqlite"))
+    catalog.refresh(force=True)
+    respobjc = await testing_application_sample.get(
+        "/f99/changelog/bash", headers={"Accept-Encoding": "gzip"}
+    )
+    assert await respobjc.text() == json.dumps(expected)  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_changelog_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/changelog/glibc")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert [item["date"] for item in otptobjc["changelogs"]] == [1700000000]  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_changelog_paged_sample(testing_application_sample):
+    # Page through the release package, which has a longer changelog than the updated one
+    os.remove(os.path.join(standard.DB_FOLDER, "mdapi-f99-updates-primary.sqlite"))
+    catalog.refresh(force=True)
+    respobjc = await testing_application_sample.get("/f99/changelog/bash")
+    expected = (await respobjc.json())["changelogs"]
+
+    pagelist, cursor = [], None
+    for _ in range(len(expected) + 1):
+        query = f"limit=1&cursor={cursor}" if cursor else "limit=1"
+        respobjc = await testing_application_sample.get(f"/f99/changelog/bash?{query}")
+        assert respobjc.status == 200  # noqa : S101
+        otptobjc = await respobjc.json()
+        pagelist.extend(otptobjc["changelogs"])
+        cursor = otptobjc["next"]
+        if not cursor:
+            break
+    assert pagelist == sorted(expected, key=lambda item: -item["date"])  # noqa : S101
+    assert len(pagelist) == 3  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/changelog/bash?since=1690000000")
+    otptobjc = await respobjc.json()
+    assert all(item["date"] >= 1690000000 for item in otptobjc["changelogs"])  # noqa : S101
+    assert otptobjc["next"] is None  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_files_paged_sample(testing_application_sample):
+    os.remove(os.path.join(standard.DB_FOLDER, "mdapi-f99-updates-primary.sqlite"))
+    catalog.refresh(force=True)
+    respobjc = await testing_application_sample.get("/f99/files/bash")
+    expected = (await respobjc.json())["files"]
+
+    respobjc = await testing_application_sample.get("/f99/files/bash?limit=1")
+    otptobjc = await respobjc.json()
+    pagelist = otptobjc["files"]
+    respobjc = await testing_application_sample.get(f"/f99/files/bash?cursor={otptobjc['next']}")
+    otptobjc = await respobjc.json()
+    pagelist.extend(otptobjc["files"])
+    assert otptobjc["next"] is None  # noqa : S101
+    assert sorted(pagelist, key=str) == sorted(expected, key=str)  # noqa : S101
+    assert len(expected) == 2  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param("limit=0", id="Null limit"),
+        pytest.param("limit=many", id="Invalid limit"),
+        pytest.param("cursor=1.x", id="Invalid cursor"),
+    ],
+)
+async def test_view_changelog_paged_invalid(testing_application_sample, query):
+    respobjc = await testing_application_sample.get(f"/f99/changelog/bash?{query}")
+    assert respobjc.status == 400  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_file_owners_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/whatprovidesfile?path=/usr/bin/sh")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert otptobjc["truncated"] is False  # noqa : S101
+    assert [  # noqa : S101
+        (item["path"], item["name"], item["release"], item["repo"]) for item in otptobjc["files"]
+    ] == [("/usr/bin/sh", "bash", "2.fc99", "updates")]
+
+    # The release package of bash is hidden by the updated one
+    respobjc = await testing_application_sample.get("/f99/whatprovidesfile?prefix=/usr/share/")
+    assert (await respobjc.json())["files"] == []  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/whatprovidesfile?prefix=/usr/lib64")
+    otptobjc = await respobjc.json()
+    assert [item["path"] for item in otptobjc["files"]] == [  # noqa : S101
+        "/usr/lib64/libc.so.6",
+        "/usr/lib64/python3.12/os.py",
+        "/usr/lib64/python3.12/re.py",
+    ]
+    assert {item["name"] for item in otptobjc["files"]} == {"glibc", "python3-libs"}  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/whatprovidesfile?prefix=/usr&limit=2")
+    otptobjc = await respobjc.json()
+    assert len(otptobjc["files"]) == 2 and otptobjc["truncated"]  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/whatprovidesfile?path=/usr/bin/nothing")
+    assert (await respobjc.json())["files"] == []  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param("", id="No path"),
+        pytest.param("path=/usr/bin/sh&prefix=/usr", id="Both paths"),
+        pytest.param("path=usr/bin/sh", id="Relative path"),
+        pytest.param("prefix=/usr&limit=0", id="Null limit"),
+    ],
+)
+async def test_view_file_owners_sample_invalid(testing_application_sample, query):
+    respobjc = await testing_application_sample.get(f"/f99/whatprovidesfile?{query}")
+    assert respobjc.status == 400  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_search_sample(testing_application_sample, monkeypatch):
+    respobjc = await testing_application_sample.get("/f99/search?q=python3")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert otptobjc["results"][0]["name"] == "python3"  # noqa : S101
+    assert {item["name"] for item in otptobjc["results"]} == {  # noqa : S101
+        "python3",
+        "python3-libs",
+        "python3-natsort",
+    }
+    assert otptobjc["next"] is None  # noqa : S101
+
+    # The release package of bash is hidden by the updated one
+    respobjc = await testing_application_sample.get("/f99/search?q=bash package")
+    otptobjc = await respobjc.json()
+    assert [(item["name"], item["repo"]) for item in otptobjc["results"]] == [  # noqa : S101
+        ("bash", "updates")
+    ]
+
+    pagelist, cursor = [], "0"
+    while cursor:
+        query = f"q=package&limit=2&cursor={cursor}"
+        respobjc = await testing_application_sample.get(f"/f99/search?{query}")
+        otptobjc = await respobjc.json()
+        pagelist.extend(item["name"] for item in otptobjc["results"])
+        cursor = otptobjc["next"]
+    assert sorted(pagelist) == sorted(set(pagelist))  # noqa : S101
+    assert len(pagelist) == 8  # noqa : S101
+
+    # The pages stop once as many results as can be skipped were listed
+    monkeypatch.setitem(standard.SEARCH, "depth", 4)
+    respobjc = await testing_application_sample.get("/f99/search?q=package&limit=1&cursor=4")
+    otptobjc = await respobjc.json()
+    assert (len(otptobjc["results"]), otptobjc["next"]) == (1, None)  # noqa : S101
+    respobjc = await testing_application_sample.get("/f99/search?q=package&limit=1&cursor=5")
+    assert respobjc.status == 400  # noqa : S101
+
+    # Nothing in the text is taken for the query syntax
+    respobjc = await testing_application_sample.get('/f99/search?q=bash" OR "glibc')
+    assert (await respobjc.json())["results"] == []  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param("", id="No text"),
+        pytest.param("q=%20", id="Blank text"),
+        pytest.param("q=" + "x" * 257, id="Long text"),
+        pytest.param("q=bash&cursor=-1", id="Negative cursor"),
+        pytest.param("q=bash&cursor=1001", id="Deep cursor"),
+    ],
+)
+async def test_view_search_sample_invalid(testing_application_sample, query):
+    respobjc = await testing_application_sample.get(f"/f99/search?{query}")
+    assert respobjc.status == 400  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "fragment, names",
+    [
+        pytest.param("pyhton3", ["python3", "python3-libs"], id="Misspelled name"),
+        pytest.param("python3-lib", ["python3-libs", "python3"], id="Partial name"),
+        pytest.param("GLIBC", ["glibc", "glibc-common"], id="Capitalized name"),
+        pytest.param("fo", ["foo", "foo-bar"], id="Short fragment"),
+        pytest.param("Fo", ["foo", "foo-bar"], id="Capitalized short fragment"),
+        pytest.param("BA", ["bash"], id="Uppercase short fragment"),
+        pytest.param("%F4%8F%BF%BF", [], id="Last character of Unicode"),
+        pytest.param("%ED%9F%BF", [], id="Character preceding the surrogates"),
+    ],
+)
+async def test_view_suggest_sample(testing_application_sample, fragment, names):
+    respobjc = await testing_application_sample.get(f"/f99/suggest/{fragment}?limit=2")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert [item["name"] for item in otptobjc["suggestions"]] == names  # noqa : S101
+    scores = [item["score"] for item in otptobjc["suggestions"]]
+    assert scores == sorted(scores, reverse=True)  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_closure_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/closure/python3-natsort")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert otptobjc["requires"] == [  # noqa : S101
+        {"name": "python3", "depth": 1, "repo": "release"},
+        {"name": "glibc", "depth": 2, "repo": "release"},
+        {"name": "python3-libs", "depth": 2, "repo": "release"},
+        {"name": "bash", "depth": 3, "repo": "updates"},
+    ]
+    assert otptobjc["unresolved"] == []  # noqa : S101
+
+    # The requirements missing from the updates are provided by the release
+    respobjc = await testing_application_sample.get("/f99/closure/bash")
+    otptobjc = await respobjc.json()
+    assert otptobjc["requires"] == [{"name": "glibc", "depth": 1, "repo": "release"}]  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/closure/nothing")
+    assert respobjc.status == 404  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_impact_sample(testing_application_sample):
+    respobjc = await testing_application_sample.get("/f99/impact/glibc")
+    assert respobjc.status == 200  # noqa : S101
+    otptobjc = await respobjc.json()
+    assert otptobjc["source"] == "glibc"  # noqa : S101
+    # The bash of the updates only requires glibc through the release
+    assert otptobjc["packages"] == [  # noqa : S101
+        {"name": "glibc", "depth": 0, "repo": "release"},
+        {"name": "glibc-common", "depth": 0, "repo": "release"},
+        {"name": "bash", "depth": 1, "repo": "updates"},
+        {"name": "python3", "depth": 1, "repo": "release"},
+        {"name": "python3-libs", "depth": 1, "repo": "release"},
+        {"name": "python3-natsort", "depth": 2, "repo": "release"},
+    ]
+    assert otptobjc["truncated"] is False  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/impact/glibc?depth=1")
+    otptobjc = await respobjc.json()
+    assert [item["name"] for item in otptobjc["packages"]][-1] == "python3-libs"  # noqa : S101
+    assert otptobjc["truncated"] is True  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/impact/python-natsort")
+    otptobjc = await respobjc.json()
+    assert otptobjc["packages"] == [  # noqa : S101
+        {"name": "python3-natsort", "depth": 0, "repo": "release"}
+    ]
+    assert otptobjc["truncated"] is False  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/f99/impact/nothing")
+    assert respobjc.status == 404  # noqa : S101
+    respobjc = await testing_application_sample.get("/f99/impact/glibc?depth=many")
+    assert respobjc.status == 400  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_view_impact_sample_crossing(
+    testing_application_sample, sample_location, monkeypatch
+):
+    resolved = []
+    resolve_crossing = mdapi.services._resolve_crossing
+
+    async def counted_resolve_crossing(graphs):
+        resolved.append(len(graphs))
+        return await resolve_crossing(graphs)
+
+    monkeypatch.setattr(mdapi.services, "_resolve_crossing", counted_resolve_crossing)
+    monkeypatch.setattr(mdapi.services, "crossings", {})
+
+    # The requirements across the repositories are resolved once for the databases of the branch
+    respobjc = await testing_application_sample.get("/f99/impact/glibc")
+    expected = await respobjc.text()
+    for query in ("?depth=5", "?depth=3"):
+        respobjc = await testing_application_sample.get(f"/f99/impact/glibc{query}")
+        assert respobjc.status == 200  # noqa : S101
+    assert resolved == [2]  # noqa : S101
+
+    # They are compiled into the unified database, so that they do not have to be resolved at all
+    mdapi.database.main.unify_branches()
+    catalog.refresh(force=True)
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-unified.sqlite")
+    with sqlite3.connect(dtbsfile) as connobjc:
+        rowslist = sorted(connobjc.execute("SELECT name, dependent, repo FROM crossing"))
+    assert rowslist == [("glibc", "bash", "updates")]  # noqa : S101
+    monkeypatch.setattr(mdapi.services, "crossings", {})
+    respobjc = await testing_application_sample.get("/f99/impact/glibc")
+    assert await respobjc.text() == expected  # noqa : S101
+    assert resolved == [2]  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_response_cache_sample(testing_application_sample, sample_location):
+    respobjc = await testing_application_sample.get("/stats")
+    statsold = (await respobjc.json())["cache"]
+
+    for _ in range(3):
+        respobjc = await testing_application_sample.get("/f99/pkg/glibc")
+        assert respobjc.status == 200  # noqa : S101
+        assert (await respobjc.json())["version"] == "2.39"  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/stats")
+    statsnew = (await respobjc.json())["cache"]
+    assert statsnew["misses"] - statsold["misses"] == 1  # noqa : S101
+    assert statsnew["hits"] - statsold["hits"] == 2  # noqa : S101
+
+    # Replacing any database of the branch invalidates what was cached for it
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-other.sqlite")
+    shutil.copy(dtbsfile, f"{dtbsfile}.new")
+    shutil.move(f"{dtbsfile}.new", dtbsfile)
+    catalog.refresh(force=True)
+
+    respobjc = await testing_application_sample.get("/f99/pkg/glibc")
+    respobjc = await testing_application_sample.get("/stats")
+    assert (await respobjc.json())["cache"]["misses"] - statsnew["misses"] == 1  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_search_cache_sample(testing_application_sample, monkeypatch):
+    monkeypatch.setitem(standard.RESPONSE_CACHE, "entries", 1)
+    respobjc = await testing_application_sample.get("/f99/pkg/glibc")
+    assert respobjc.status == 200  # noqa : S101
+    respobjc = await testing_application_sample.get("/stats")
+    statsold = await respobjc.json()
+
+    # Every keystroke of the suggestions is another query, kept apart from the package responses
+    for path in ["/f99/suggest/g", "/f99/suggest/gl", "/f99/suggest/gli", "/f99/search?q=glibc"]:
+        respobjc = await testing_application_sample.get(path)
+        assert respobjc.status == 200  # noqa : S101
+    respobjc = await testing_application_sample.get("/f99/pkg/glibc")
+    assert respobjc.status == 200  # noqa : S101
+
+    respobjc = await testing_application_sample.get("/stats")
+    statsnew = await respobjc.json()
+    assert statsnew["cache"]["hits"] - statsold["cache"]["hits"] == 1  # noqa : S101
+    assert statsnew["cache"]["misses"] == statsold["cache"]["misses"]  # noqa : S101
+    assert statsnew["search_cache"]["entries"] >= 4  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "path", ["/f99/pkg/glibc", "/f99/files/bash", "/f99/requires/foo", "/branches"]
+)
+async def test_conditional_get_sample(testing_application_sample, path):
+    respobjc = await testing_application_sample.get(path)
+    assert respobjc.status == 200  # noqa : S101
+    etag, lastmod = respobjc.headers["ETag"], respobjc.headers["Last-Modified"]
+
+    respobjc = await testing_application_sample.get(path, headers={"If-None-Match": etag})
+    assert respobjc.status == 304  # noqa : S101
+    assert respobjc.headers["ETag"] == etag  # noqa : S101
+
+    respobjc = await testing_application_sample.get(path, headers={"If-Modified-Since": lastmod})
+    assert respobjc.status == 304  # noqa : S101
+
+    respobjc = await testing_application_sample.get(path, headers={"If-None-Match": '"0000"'})
+    assert respobjc.status == 200  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize("kind", ["pkg", "files"])
+async def test_conditional_get_missing_sample(testing_application_sample, kind):
+    future = "Fri, 01 Jan 2100 00:00:00 GMT"
+    for headers in ({"If-None-Match": "*"}, {"If-Modified-Since": future}):
+        # The conditions hold only for the resources that exist
+        respobjc = await testing_application_sample.get(f"/f99/{kind}/nothing", headers=headers)
+        assert respobjc.status == 404  # noqa : S101
+        respobjc = await testing_application_sample.get(f"/f99/{kind}/bash", headers=headers)
+        assert respobjc.status == 304  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_conditional_get_manifest_sample(testing_application_sample, sample_location):
+    respobjc = await testing_application_sample.get("/f99/pkg/glibc")
+    etag = respobjc.headers["ETag"]
+
+    # The checksum recorded by the ingest step takes over from the identity of the file
+    record_manifest("f99", os.path.join(sample_location, "mdapi-f99-primary.sqlite"), "sha256:0")
+    catalog.refresh(force=True)
+
+    respobjc = await testing_application_sample.get("/f99/pkg/glibc")
+    assert respobjc.headers["ETag"] != etag  # noqa : S101
+    assert catalog.locate("f99", None, "primary").checksum == "sha256:0"  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "acptencd, encoding",
+    [
+        (None, None),
+        ("identity", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("gzip;q=1.0, zstd;q=0.5", "gzip"),
+        ("zstd;q=0, gzip", "gzip"),
+        ("*", "zstd"),
+    ],
+)
+def test_negotiate_encoding(acptencd, encoding):
+    assert negotiate(acptencd) == encoding  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_compressed_response_sample(testing_application_sample, monkeypatch):
+    monkeypatch.setitem(standard.COMPRESSION, "minimum", 0)
+    respobjc = await testing_application_sample.get(
+        "/f99/pkg/bash", headers={"Accept-Encoding": "identity"}
+    )
+    assert "Content-Encoding" not in respobjc.headers  # noqa : S101
+    etag, otptobjc = respobjc.headers["ETag"], await respobjc.json()
+
+    for _ in range(2):
+        respobjc = await testing_application_sample.get(
+            "/f99/pkg/bash", headers={"Accept-Encoding": "gzip"}
+        )
+        assert respobjc.headers["Content-Encoding"] == "gzip"  # noqa : S101
+        assert respobjc.headers["Vary"] == "Accept-Encoding"  # noqa : S101
+        assert respobjc.headers["ETag"] == f'{etag[:-1]}-gzip"'  # noqa : S101
+        assert await respobjc.json() == otptobjc  # noqa : S101
+
+    respobjc = await testing_application_sample.get(
+        "/f99/pkg/bash", headers={"Accept-Encoding": "gzip", "If-None-Match": f'{etag[:-1]}-gzip"'}
+    )
+    assert respobjc.status == 304  # noqa : S101
+
+
+@pytest.fixture
+def repository_server(tmp_path):
+    """
+    Serve the files of a directory over HTTP like the mirrors do, so that the ingest step can be
+    tested without downloading
+    """
+    folder, served = tmp_path / "mirror", []
+    folder.mkdir()
+
+    class RequestHandler(http.server.SimpleHTTPRequestHandler):
+        def log_request(self, code="-", size="-"):
+            served.append((self.path, int(code)))
+
+    handler = functools.partial(RequestHandler, directory=str(folder))
+    servobjc = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=servobjc.serve_forever, daemon=True).start()
+    yield (str(folder), f"http://127.0.0.1:{servobjc.server_port}", served)
+    servobjc.shutdown()
+    servobjc.server_close()
+
+
+@pytest.fixture
+def repository_mirror(repository_server, tmp_path):
+    """
+    Publish the sample databases of a branch compressed with xz along with their repomd.xml, like
+    createrepo_c does, and return the URL of the repodata directory, the requests served so far and
+    the directory served
+    """
+    folder, urlx, served = repository_server
+    os.mkdir(os.path.join(folder, "repodata"))
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    tests.fabricate_databases(str(staging), indexed=False)
+
+    datalist = []
+    for kind in ("primary", "filelists", "other"):
+        with open(staging / f"mdapi-f99-{kind}.sqlite", "rb") as fileobjc:
+            content = fileobjc.read()
+        archive = lzma.compress(content)
+        arcvname = f"{hashlib.sha256(archive).hexdigest()}-{kind}.sqlite.xz"
+        with open(os.path.join(folder, "repodata", arcvname), "wb") as fileobjc:
+            fileobjc.write(archive)
+        datalist.append(
+            f'<data type="{kind}_db">'
+            f'<checksum type="sha256">{hashlib.sha256(archive).hexdigest()}</checksum>'
+            f'<open-checksum type="sha256">{hashlib.sha256(content).hexdigest()}</open-checksum>'
+            f'<location href="repodata/{arcvname}"/>'
+            "</data>"
+        )
+    with open(os.path.join(folder, "repodata", "repomd.xml"), "w") as fileobjc:
+        fileobjc.write(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<repomd xmlns="{standard.repomd_xml_namespace["repo"]}">{"".join(datalist)}</repomd>'
+        )
+    return (f"{urlx}/repodata", served, folder)
+
+
+@pytest.mark.download_needless
+def test_fetch_database_sample(repository_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(standard, "BUFFER_SIZE", 7)
+    folder, urlx, _ = repository_server
+    content = os.urandom(100)
+    with open(os.path.join(folder, "primary.sqlite.xz"), "wb") as fileobjc:
+        fileobjc.write(content)
+    hashdata = hashlib.sha256(content).hexdigest()
+
+    location = str(tmp_path / "primary.sqlite.xz")
+    fetch_database("f99", f"{urlx}/primary.sqlite.xz", location, hashdata, "sha256")
+    with open(location, "rb") as fileobjc:
+        assert fileobjc.read() == content  # noqa : S101
+
+    # A corrupt transfer is rejected before anything gets extracted from it
+    with pytest.raises(OSError, match="does not match"):
+        fetch_database("f99", f"{urlx}/primary.sqlite.xz", location, "0" * 64, "sha256")
+    with pytest.raises(OSError):
+        fetch_database("f99", f"{urlx}/missing.sqlite.xz", location)
+
+
+@pytest.mark.download_needless
+def test_stream_database_sample(repository_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(standard, "BUFFER_SIZE", 7)
+    folder, urlx, _ = repository_server
+    content = os.urandom(100) * 10
+    archive = lzma.compress(content)
+    with open(os.path.join(folder, "primary.sqlite.xz"), "wb") as fileobjc:
+        fileobjc.write(archive)
+    hashdata = hashlib.sha256(content).hexdigest()
+    arcvhash = hashlib.sha256(archive).hexdigest()
+
+    location = str(tmp_path / "primary.sqlite")
+    repmdurl = f"{urlx}/primary.sqlite.xz"
+    stream_database("f99", repmdurl, location, hashdata, "sha256", arcvhash, "sha256")
+    with open(location, "rb") as fileobjc:
+        assert fileobjc.read() == content  # noqa : S101
+
+    # Both the archive and the database it holds are verified
+    with pytest.raises(OSError, match="does not match"):
+        stream_database("f99", repmdurl, location, hashdata, "sha256", "0" * 64, "sha256")
+    with pytest.raises(OSError, match="database"):
+        stream_database("f99", repmdurl, location, "0" * 64, "sha256", arcvhash, "sha256")
+    with pytest.raises(NotImplementedError):
+        stream_database("f99", f"{urlx}/primary.sqlite.lz", location, hashdata, "sha256")
+
+
+@pytest.mark.download_needless
+def test_process_repo_sample(repository_mirror, tmp_path, monkeypatch):
+    monkeypatch.setattr(standard, "DB_FOLDER", str(tmp_path))
+    repository_mirror, _, _ = repository_mirror
+    mdapi.database.main.process_repo((repository_mirror, "f99"))
+    manifest = read_manifest(str(tmp_path))
+    for kind in ("primary", "filelists", "other"):
+        assert os.path.isfile(tmp_path / f"mdapi-f99-{kind}.sqlite")  # noqa : S101
+        assert manifest[f"mdapi-f99-{kind}.sqlite"]["checksum"].startswith("sha256:")  # noqa : S101
+    assert [item for item in os.listdir(tmp_path) if "temp" in item] == []  # noqa : S101
+
+    # Nothing is downloaded nor hashed again as long as the manifest describes the databases
+    def unexpected(*args):
+        raise AssertionError(args)
+
+    monkeypatch.setattr(mdapi.database.main, "stream_database", unexpected)
+    monkeypatch.setattr(mdapi.database.main, "obtain_hash", unexpected)
+    mdapi.database.main.process_repo((repository_mirror, "f99"))
+
+    # A database modified since it was recorded is hashed again, and replaced as it differs
+    monkeypatch.undo()
+    monkeypatch.setattr(standard, "DB_FOLDER", str(tmp_path))
+    inodes = {item: os.stat(tmp_path / item).st_ino for item in os.listdir(tmp_path) if item.endswith(".sqlite")}  # noqa : E501
+    os.utime(tmp_path / "mdapi-f99-other.sqlite", ns=(0, 0))
+    mdapi.database.main.process_repo((repository_mirror, "f99"))
+    assert sorted(  # noqa : S101
+        item for item, inode in inodes.items() if os.stat(tmp_path / item).st_ino != inode
+    ) == ["mdapi-f99-other.sqlite"]
+
+
+@pytest.mark.download_needless
+def test_process_repo_unknown_archive_sample(repository_mirror, tmp_path, monkeypatch):
+    monkeypatch.setattr(standard, "DB_FOLDER", str(tmp_path))
+    urlx, served, folder = repository_mirror
+    repodata = os.path.join(folder, "repodata")
+    with open(os.path.join(repodata, "repomd.xml")) as fileobjc:
+        repomd = fileobjc.read()
+    for item in os.listdir(repodata):
+        if item.endswith("-primary.sqlite.xz"):
+            os.rename(os.path.join(repodata, item), os.path.join(repodata, f"{item[:-3]}.lz4"))
+            repomd = repomd.replace(item, f"{item[:-3]}.lz4")
+    with open(os.path.join(repodata, "repomd.xml"), "w") as fileobjc:
+        fileobjc.write(repomd)
+
+    # The archive that cannot be extracted is not downloaded at all
+    with pytest.raises(NotImplementedError):
+        mdapi.database.main.process_repo((urlx, "f99"))
+    assert served == [("/repodata/repomd.xml", 200)]  # noqa : S101
+    assert not os.path.exists(tmp_path / "mdapi-f99-primary.sqlite")  # noqa : S101
+
+
+@pytest.mark.download_needless
+def test_process_repo_conditional_sample(repository_mirror, tmp_path, monkeypatch):
+    monkeypatch.setattr(standard, "DB_FOLDER", str(tmp_path))
+    urlx, served, folder = repository_mirror
+    mdapi.database.main.process_repo((urlx, "f99"))
+    recorded = read_manifest(str(tmp_path))["mdapi-f99-repomd.xml"]
+    assert recorded["last-modified"]  # noqa : S101
+    assert len(recorded["databases"]) == 3  # noqa : S101
+
+    # An unchanged repository is skipped as soon as the server says so
+    served.clear()
+    mdapi.database.main.process_repo((urlx, "f99"))
+    assert served == [("/repodata/repomd.xml", 304)]  # noqa : S101
+
+    # Unless a database installed from it went missing
+    served.clear()
+    os.remove(tmp_path / "mdapi-f99-primary.sqlite")
+    mdapi.database.main.process_repo((urlx, "f99"))
+    assert [code for _, code in served] == [200, 200]  # noqa : S101
+    assert os.path.isfile(tmp_path / "mdapi-f99-primary.sqlite")  # noqa : S101
+
+    # A repomd.xml served again does not get the unchanged databases downloaded again
+    served.clear()
+    repomd = os.path.join(folder, "repodata", "repomd.xml")
+    os.utime(repomd, (os.stat(repomd).st_mtime + 10,) * 2)
+    mdapi.database.main.process_repo((urlx, "f99"))
+    assert served == [("/repodata/repomd.xml", 200)]  # noqa : S101
+
+    # The connections are kept alive from a request to the next, by every thread on its own
+    sessobjc = mdapi.database.main.obtain_session()
+    assert mdapi.database.main.obtain_session() is sessobjc  # noqa : S101
+    with ThreadPoolExecutor(1) as executor:
+        assert executor.submit(mdapi.database.main.obtain_session).result() is not sessobjc  # noqa : S101
+
+
+@pytest.mark.download_needless
+@pytest.mark.parametrize(
+    "suffix, compress",
+    [
+        pytest.param(".xz", lzma.compress, id="xz"),
+        pytest.param(".gz", gzip.compress, id="gzip"),
+        pytest.param(".bz2", bz2.compress, id="bzip2"),
+        pytest.param(".zst", pyzstd.compress, id="zstd"),
+    ],
+)
+def test_extract_database_sample(tmp_path, monkeypatch, suffix, compress):
+    monkeypatch.setattr(standard, "BUFFER_SIZE", 7)
+    content = os.urandom(100) * 10
+    arcvname = str(tmp_path / f"primary.sqlite{suffix}")
+    with open(arcvname, "wb") as fileobjc:
+        fileobjc.write(compress(content))
+
+    location = str(tmp_path / "primary.sqlite")
+    extract_database("f99", arcvname, location)
+    with open(location, "rb") as fileobjc:
+        assert fileobjc.read() == content  # noqa : S101
+
+    os.rename(arcvname, f"{arcvname}.lz")
+    with pytest.raises(NotImplementedError):
+        extract_database("f99", f"{arcvname}.lz", location)
+
+
+@pytest.mark.download_needless
+def test_ingest_repositories(monkeypatch):
+    monkeypatch.setattr(standard, "CRON_SLEEP", 0)
+    attempts = []
+
+    def process_repo(repo):
+        attempts.append(repo[1])
+        if repo[1] == "broken" or (repo[1] == "flaky" and attempts.count("flaky") == 1):
+            raise OSError(f"Invalid stream from {repo[0]}")
+        if repo[1] == "faulty":
+            raise ValueError(f"Invalid document from {repo[0]}")
+
+    monkeypatch.setattr(mdapi.database.main, "process_repo", process_repo)
+    repolist = [(f"https://example.com/{name}", name) for name in ("broken", "flaky", "faulty", "fine")]  # noqa : E501
+    failures = mdapi.database.main.ingest_repositories(repolist)
+    assert failures == ["broken", "faulty"]  # noqa : S101
+    assert sorted(attempts) == ["broken"] * 4 + ["faulty"] + ["fine"] + ["flaky"] * 2  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_unified_branch_sample(testing_application_sample, sample_location, monkeypatch):
+    paths = ["/f99/pkg/bash", "/f99/pkg/foo", "/f99/srcpkg/python3.12", "/f99/pkg/nothing"]
+    expected = []
+    for path in paths:
+        respobjc = await testing_application_sample.get(path)
+        expected.append((respobjc.status, await respobjc.text()))
+    respobjc = await testing_application_sample.post("/f99/pkgs", json=["bash", "foo", "nothing"])
+    expected.append((respobjc.status, await respobjc.text()))
+
+    mdapi.database.main.unify_branches()
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-unified.sqlite")
+    manifest = read_manifest(sample_location)
+    assert sorted(manifest["mdapi-f99-unified.sqlite"]["sources"]) == ["release", "updates"]  # noqa : S101
+    inode = os.stat(dtbsfile).st_ino
+
+    # It is only built again when any of the databases it is built from changes
+    mdapi.database.main.unify_branches()
+    assert os.stat(dtbsfile).st_ino == inode  # noqa : S101
+
+    # The packages are found in the unified database and described just the same
+    catalog.refresh(force=True)
+    assert catalog.locate("f99", None, "unified").dtbsfile == dtbsfile  # noqa : S101
+    for path, (status, text) in zip(paths, expected):
+        respobjc = await testing_application_sample.get(path)
+        assert (respobjc.status, await respobjc.text()) == (status, text)  # noqa : S101
+    respobjc = await testing_application_sample.post("/f99/pkgs", json=["bash", "foo", "nothing"])
+    assert (respobjc.status, await respobjc.text()) == expected[-1]  # noqa : S101
+    assert (dtbsfile, LANE_DEFAULT) in pool.entries  # noqa : S101
+
+    # It is left aside as soon as any of the databases it is built from changes
+    record_manifest("f99", os.path.join(sample_location, "mdapi-f99-updates-primary.sqlite"), "sha256:0")  # noqa : E501
+    catalog.refresh(force=True)
+    assert catalog.locate("f99", None, "unified") is None  # noqa : S101
+    respobjc = await testing_application_sample.get("/f99/pkg/bash")
+    assert (await respobjc.json())["repo"] == "updates"  # noqa : S101
+
+
+@pytest.mark.download_needless
+async def test_pool_reopens_replaced_database(testing_application_sample, sample_location):
+    dtbsfile = os.path.join(sample_location, "mdapi-f99-updates-primary.sqlite")
+    respobjc = await testing_application_sample.get("/f99/pkg/bash")
+    assert (await respobjc.json())["repo"] == "updates"  # noqa : S101
+    entry = pool.entries[(dtbsfile, LANE_DEFAULT)]
+
+    # Install the release database in place of the updates one, like the ingest step does
+    shutil.copy(os.path.join(sample_location, "mdapi-f99-primary.sqlite"), f"{dtbsfile}.new")
+    shutil.move(f"{dtbsfile}.new", dtbsfile)
+    catalog.refresh(force=True)
+
+    respobjc = await testing_application_sample.get("/f99/pkg/bash")
+    assert (await respobjc.json())["release"] == "1.fc99"  # noqa : S101
+    assert pool.entries[(dtbsfile, LANE_DEFAULT)] is not entry  # noqa : S101
+    assert entry.stale  # noqa : S101